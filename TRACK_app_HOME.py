@@ -1,5 +1,13 @@
 import streamlit as st
 
+from track import warmup
+
+# Parse, derive and index every dataset in the background, once per server process, so the first visit of
+# each page does not pay for it (TRACK_WARMUP=0 disables it; TRACK_PREWARM_STATION_VIEWS=1 also renders
+# every filter combination of the stations page)
+if warmup.ENABLED:
+    warmup.start_warmup()
+
 # Title of the web app
 st.title("TRACK: Train Railway Analytics for Commuter Knowledge 🚆 🛤️")
 st.write("Explore the French Railway Network")
@@ -24,3 +32,21 @@ st.write("""
 # Call to Action
 st.write("Start exploring and discover the dynamics of the French railway system with TRACK! 📊")
 st.write("Select from the menu on the left to navigate through the features.")
+
+# Readiness of the data behind the pages
+if warmup.ENABLED:
+    report = warmup.warmup_report()
+    failed = warmup.warmup_failures()
+    if not warmup.warmup_ready():
+        done = sum(row['state'] in ('done', 'skipped') for row in report)
+        label = f"Preparing data ({done}/{len(report) or '…'} steps)"
+    elif failed:
+        label = f"Data partly ready ({len(failed)} of {len(report)} steps failed)"
+    else:
+        label = "Data ready"
+    with st.expander(label):
+        icons = {'pending': '⏳', 'running': '🔄', 'done': '✅', 'skipped': '➖', 'failed': '❌'}
+        for row in report:
+            seconds = f" ({row['seconds']:.2f} s)" if row['seconds'] is not None else ""
+            error = f" — {row['error']}" if row['error'] else ""
+            st.write(f"{icons[row['state']]} {row['step']}{seconds}{error}")
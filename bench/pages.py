@@ -0,0 +1,228 @@
+# Page benchmarks: runs every page script headlessly with Streamlit's AppTest and records, per page and
+# widget state, the cold run time (first run in a fresh process), warm run times (same process, caches
+# filled), peak traced memory and the size of the rendered elements sent to the browser.
+#
+#   python bench/pages.py                          # all pages, results saved under bench/results/
+#   python bench/pages.py French Prices            # pages whose file name contains one of the words
+#   python bench/pages.py --compare bench/results/<earlier run>.json
+#   python bench/pages.py --clear-cache            # also drop the dataset cache before each page
+#   python bench/pages.py --sessions 20            # also measure the memory of 20 concurrent sessions
+#
+# Each page runs in its own subprocess, so per-process memos never leak from one page to the next.
+import argparse
+import datetime
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows: no peak resident memory
+    resource = None
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "bench" / "results"
+PAGES = ["TRACK_app_HOME.py"] + sorted(str(path.relative_to(ROOT)) for path in (ROOT / "pages").glob("*.py"))
+
+# Widget states measured for each page besides its default state: widget label -> value to set
+SCENARIOS = {
+    "French stations.py": {
+        "category A": {"Select a station category": "A"},
+        "Ile-de-France": {"Select a region (optional)": "Île-de-France"},
+        "around Lyon Part Dieu": {"Reference station (optional)": "Lyon Part Dieu"},
+    },
+    "Station use (2015-2023).py": {
+        "category B": {"Station Category": "B"},
+    },
+    "Regularity on the network.py": {
+        "national service": {"Service": "National"},
+        "from Paris Lyon": {"Departure station": "PARIS LYON"},
+    },
+    "Prices by lines (2024).py": {
+        "Paris Gare de Lyon to Marseille": {"Select Departure Station": "PARIS GARE DE LYON",
+                                            "Select Arrival Station": "MARSEILLE ST CHARLES"},
+    },
+    # Stations are selected by UIC code; the section only shows with the railway lines file present
+    "Railway lines.py": {
+        "Lyon Part Dieu to Marseille": {"Departure station": 87723197, "Arrival station": 87751008},
+    },
+}
+
+WIDGET_KINDS = ("selectbox", "multiselect", "slider", "select_slider", "radio", "checkbox", "number_input",
+                "text_input")
+
+
+def _widget(app, label):
+    for kind in WIDGET_KINDS:
+        for widget in app.get(kind):
+            if widget.label == label:
+                return widget
+    raise LookupError(f"No widget labelled {label!r}")
+
+
+# Serialized size of every element of the rendered page, by element type
+def payload_sizes(app):
+    sizes = {}
+
+    def walk(node):
+        children = getattr(node, "children", None)
+        if children:
+            for child in children.values():
+                walk(child)
+            return
+        proto = getattr(node, "proto", None)
+        if proto is not None and hasattr(proto, "ByteSize"):
+            sizes[node.type] = sizes.get(node.type, 0) + proto.ByteSize()
+
+    walk(app._tree)
+    return sizes
+
+
+def _rss_mb():
+    from track.profiling import current_rss
+
+    rss = current_rss()
+    return rss / 2 ** 20 if rss is not None else None
+
+
+# Peak resident memory of the process (ru_maxrss is in KiB on Linux), None without the resource module
+def _max_rss_mb():
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _run(app):
+    start = time.perf_counter()
+    app.run()
+    elapsed = time.perf_counter() - start
+    if app.exception:
+        raise RuntimeError(app.exception[0].value)
+    return elapsed
+
+
+# Measures one page in the current process; called in a subprocess by main()
+def bench_page(page, warm_runs, sessions=0):
+    from streamlit.testing.v1 import AppTest
+
+    results = []
+    states = {"default": {}, **SCENARIOS.get(Path(page).name, {})}
+    for state, widgets in states.items():
+        app = AppTest.from_file(str(ROOT / page), default_timeout=600)
+        if widgets:
+            _run(app)
+            try:
+                for label, value in widgets.items():
+                    _widget(app, label).set_value(value)
+            except LookupError as error:
+                # The page stopped before showing the widget, e.g. for a missing data file
+                print(f"{page} [{state}]: skipped, {error}", file=sys.stderr)
+                continue
+        first = _run(app)
+        warm = [_run(app) for _ in range(warm_runs)]
+
+        tracemalloc.start()
+        _run(app)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        sizes = payload_sizes(app)
+        results.append({
+            "page": page,
+            "state": state,
+            # The default state is the first run of the process; later states already share its loaded data
+            "cold_s": round(first, 4) if state == "default" else None,
+            "first_s": round(first, 4),
+            "warm_s": round(statistics.median(warm), 4) if warm else None,
+            "peak_traced_mb": round(peak / 2 ** 20, 2),
+            "max_rss_mb": _max_rss_mb(),
+            "payload_bytes": sum(sizes.values()),
+            "payload_by_element": sizes,
+        })
+
+    # Resident memory added by each extra session showing the default state, all sessions kept alive: the
+    # datasets, derived tables and rendered views are shared, so this is the per-session state only
+    if sessions and results:
+        before = _rss_mb()
+        apps = [AppTest.from_file(str(ROOT / page), default_timeout=600) for _ in range(sessions)]
+        for app in apps:
+            _run(app)
+        after = _rss_mb()
+        if before is not None:
+            results[0]["rss_per_session_mb"] = round((after - before) / sessions, 2)
+    return results
+
+
+def compare(current, baseline):
+    previous = {(row["page"], row["state"]): row for row in baseline["results"]}
+    print(f"\nCompared with {baseline['timestamp']}:")
+    for row in current:
+        before = previous.get((row["page"], row["state"]))
+        if before is None:
+            continue
+        changes = []
+        for metric in ("cold_s", "warm_s", "peak_traced_mb", "payload_bytes", "rss_per_session_mb"):
+            if row.get(metric) is not None and before.get(metric):
+                changes.append(f"{metric} {100 * (row[metric] - before[metric]) / before[metric]:+.0f}%")
+        print(f"  {row['page']} [{row['state']}]: {', '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the TRACK pages with AppTest")
+    parser.add_argument("pages", nargs="*", help="only pages whose file name contains one of these words")
+    parser.add_argument("--warm-runs", type=int, default=3)
+    parser.add_argument("--clear-cache", action="store_true", help="delete the dataset cache before each page")
+    parser.add_argument("--sessions", type=int, default=0, help="concurrent sessions to measure memory with")
+    parser.add_argument("--compare", type=Path, help="earlier results file to compare with")
+    parser.add_argument("--output", type=Path, help="results file (default: bench/results/<timestamp>.json)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(bench_page(args.worker, args.warm_runs, args.sessions)))
+        return
+
+    # The background warm-up is off so that it does not load tables while the first run is being timed
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")])),
+           "TRACK_WARMUP": "0"}
+    cache_dir = Path(env.get("TRACK_CACHE_DIR", ROOT / ".track_cache"))
+    pages = [page for page in PAGES if not args.pages or any(word in page for word in args.pages)]
+
+    results = []
+    for page in pages:
+        if args.clear_cache:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        worker = subprocess.run(
+            [sys.executable, __file__, "--worker", page, "--warm-runs", str(args.warm_runs),
+             "--sessions", str(args.sessions)],
+            cwd=ROOT, env=env, capture_output=True, text=True,
+        )
+        if worker.returncode:
+            print(f"{page}: failed\n{worker.stderr.strip().splitlines()[-1] if worker.stderr else ''}")
+            continue
+        for row in json.loads(worker.stdout.strip().splitlines()[-1]):
+            results.append(row)
+            cold = f"cold {row['cold_s']:.3f}s, " if row["cold_s"] is not None else ""
+            print(f"{row['page']} [{row['state']}]: {cold}first {row['first_s']:.3f}s, warm {row['warm_s']}s, "
+                  f"peak {row['peak_traced_mb']} MB, payload {row['payload_bytes'] / 1024:.0f} KB"
+                  + (f", {row['rss_per_session_mb']} MB per extra session" if "rss_per_session_mb" in row else ""))
+
+    timestamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    output = args.output or RESULTS_DIR / f"{timestamp}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({"timestamp": timestamp, "python": sys.version.split()[0], "results": results},
+                                 indent=2))
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,18 @@
 import streamlit as st
-import pandas as pd
-import folium
-from streamlit_folium import folium_static
-import plotly.express as px
-import os
+import streamlit.components.v1 as components
+import plotly.io as pio
+
+from track import profiling
+from track.density import HEX_LEVELS, get_density_map, load_traffic_hexbins
+from track.profiling import timed
+from track.regions import REGION_COLORS
+from track.station_views import (MAP_HEIGHT, MAP_WIDTH, get_area_views, get_station_views, nearest_stations,
+                                 station_categories, station_regions)
+from track.ui import load_data, show_profile
+
+NO_STATION = 'None'
+
+profiling.begin("French stations")
 
 # Title of the web app
 st.title("TRACK: Train Railway Analytics for Commuter Knowledge")
@@ -12,90 +21,14 @@ st.title("TRACK: Train Railway Analytics for Commuter Knowledge")
 st.sidebar.title("TRACK Dashboard")
 st.sidebar.write("Use the options below to filter and explore station data.")
 
-
-# Load the dataset with error handling
-@st.cache_data
-def load_data():
-    if not os.path.exists("./datasets/gares-de-voyageurs.csv"):
-        st.error("Data file not found.")
-        return pd.DataFrame()  # Return an empty DataFrame
-    return pd.read_csv("./datasets/gares-de-voyageurs.csv", delimiter=';')
-
-
-stations_data = load_data()
+# Load the dataset (coordinates, department and region are derived by the data layer)
+stations_data = load_data("stations")
 
 if not stations_data.empty:
-    # Split 'position_geographique' column into 'latitude' and 'longitude'
-    stations_data[['latitude', 'longitude']] = stations_data['position_geographique'].str.split(',', expand=True)
-
-    # Convert 'latitude' and 'longitude' columns to float
-    stations_data['latitude'] = pd.to_numeric(stations_data['latitude'], errors='coerce')
-    stations_data['longitude'] = pd.to_numeric(stations_data['longitude'], errors='coerce')
-
-    # Drop rows with NaN values in 'latitude' or 'longitude'
-    stations_data = stations_data.dropna(subset=['latitude', 'longitude'])
-
-    # Define department to region mapping (only metropolitan regions)
-    department_to_region = {
-        '01': 'Auvergne-Rhône-Alpes', '02': 'Hauts-de-France', '03': 'Auvergne-Rhône-Alpes',
-        '04': 'Provence-Alpes-Côte d\'Azur', '05': 'Provence-Alpes-Côte d\'Azur',
-        '06': 'Provence-Alpes-Côte d\'Azur', '07': 'Auvergne-Rhône-Alpes', '08': 'Grand Est',
-        '09': 'Occitanie', '10': 'Grand Est', '11': 'Occitanie', '12': 'Occitanie',
-        '13': 'Provence-Alpes-Côte d\'Azur', '14': 'Normandie', '15': 'Auvergne-Rhône-Alpes',
-        '16': 'Nouvelle-Aquitaine', '17': 'Nouvelle-Aquitaine', '18': 'Centre-Val de Loire',
-        '19': 'Nouvelle-Aquitaine', '20': 'Île-de-France', '21': 'Bourgogne-Franche-Comté',
-        '22': 'Bretagne', '23': 'Nouvelle-Aquitaine', '24': 'Nouvelle-Aquitaine',
-        '25': 'Bourgogne-Franche-Comté', '26': 'Auvergne-Rhône-Alpes', '27': 'Normandie',
-        '28': 'Centre-Val de Loire', '29': 'Bretagne', '30': 'Occitanie', '31': 'Occitanie',
-        '32': 'Occitanie', '33': 'Nouvelle-Aquitaine', '34': 'Occitanie', '35': 'Bretagne',
-        '36': 'Centre-Val de Loire', '37': 'Centre-Val de Loire', '38': 'Auvergne-Rhône-Alpes',
-        '39': 'Bourgogne-Franche-Comté', '40': 'Nouvelle-Aquitaine', '41': 'Centre-Val de Loire',
-        '42': 'Auvergne-Rhône-Alpes', '43': 'Auvergne-Rhône-Alpes', '44': 'Pays de la Loire',
-        '45': 'Centre-Val de Loire', '46': 'Occitanie', '47': 'Nouvelle-Aquitaine',
-        '48': 'Occitanie', '49': 'Pays de la Loire', '50': 'Normandie', '51': 'Grand Est',
-        '52': 'Grand Est', '53': 'Pays de la Loire', '54': 'Grand Est', '55': 'Grand Est',
-        '56': 'Bretagne', '57': 'Grand Est', '58': 'Bourgogne-Franche-Comté', '59': 'Hauts-de-France',
-        '60': 'Hauts-de-France', '61': 'Normandie', '62': 'Hauts-de-France', '63': 'Auvergne-Rhône-Alpes',
-        '64': 'Nouvelle-Aquitaine', '65': 'Occitanie', '66': 'Occitanie', '67': 'Grand Est',
-        '68': 'Grand Est', '69': 'Auvergne-Rhône-Alpes', '70': 'Bourgogne-Franche-Comté',
-        '71': 'Bourgogne-Franche-Comté', '72': 'Pays de la Loire', '73': 'Auvergne-Rhône-Alpes',
-        '74': 'Auvergne-Rhône-Alpes', '75': 'Île-de-France', '76': 'Normandie',
-        '77': 'Île-de-France', '78': 'Île-de-France', '79': 'Nouvelle-Aquitaine',
-        '80': 'Hauts-de-France', '81': 'Occitanie', '82': 'Occitanie', '83': 'Provence-Alpes-Côte d\'Azur',
-        '84': 'Provence-Alpes-Côte d\'Azur', '85': 'Pays de la Loire', '86': 'Nouvelle-Aquitaine',
-        '87': 'Nouvelle-Aquitaine', '88': 'Grand Est', '89': 'Bourgogne-Franche-Comté',
-        '90': 'Bourgogne-Franche-Comté', '91': 'Île-de-France', '92': 'Île-de-France',
-        '93': 'Île-de-France', '94': 'Île-de-France', '95': 'Île-de-France'
-    }
-
-    # Define colors for each region
-    region_colors = {
-        'Auvergne-Rhône-Alpes': 'blue',
-        'Bourgogne-Franche-Comté': 'green',
-        'Bretagne': 'red',
-        'Centre-Val de Loire': 'purple',
-        'Grand Est': 'darkred',
-        'Hauts-de-France': 'lightred',
-        'Île-de-France': 'beige',
-        'Normandie': 'darkblue',
-        'Nouvelle-Aquitaine': 'darkgreen',
-        'Occitanie': 'cadetblue',
-        'Pays de la Loire': 'lightgreen',
-        'Provence-Alpes-Côte d\'Azur': 'lightblue',
-    }
-
     # Add filters in the sidebar
-    unique_categories = stations_data['segment_drg'].str.split(';').explode().unique()
-    unique_categories = [cat for cat in unique_categories if cat in ['A', 'B', 'C']]
-    ordered_categories = ['All categories'] + sorted(unique_categories)
+    category = st.sidebar.selectbox("Select a station category", station_categories(stations_data))
 
-    category = st.sidebar.selectbox("Select a station category", ordered_categories)
-
-    # Extract unique regions correctly
-    stations_data['department'] = stations_data['codeinsee'].astype(str).str.zfill(5).str[:2]
-    unique_regions = stations_data['department'].map(department_to_region).unique()
-
-    region = st.sidebar.selectbox("Select a region (optional)", ['All regions'] + sorted(unique_regions.tolist()))
+    region = st.sidebar.selectbox("Select a region (optional)", station_regions(stations_data))
 
     # Dictionary for category meanings
     category_meanings = {
@@ -109,55 +42,65 @@ if not stations_data.empty:
     st.sidebar.write(f"**Meaning of category \"{category}\":**")
     st.sidebar.write(category_meanings[category])
 
-    # Filter the data based on the selected category
-    filtered_data = stations_data[
-        stations_data['segment_drg'].str.contains(category)] if category != 'All categories' else stations_data
-
-    # Further filter by region if specified
-    if region != 'All regions':
-        filtered_data = filtered_data[filtered_data['department'].map(department_to_region) == region]
-
-    # Create a new column for regions based on department
-    filtered_data['region'] = filtered_data['department'].map(department_to_region)
-
-    # Count the number of stations in each region
-    region_counts = filtered_data['region'].value_counts().reset_index()
-    region_counts.columns = ['Region', 'Number of Stations']
+    # Optional search around a station: nearest stations and a map limited to the surrounding area
+    st.sidebar.write("**Search around a station:**")
+    station_names = stations_data['nom'].drop_duplicates().sort_values().tolist()
+    center_name = st.sidebar.selectbox("Reference station (optional)", [NO_STATION] + station_names)
+    radius_km = st.sidebar.slider("Search radius (km)", min_value=5, max_value=100, value=25, step=5)
 
-    # Plotting the number of stations per region using Plotly
-    fig = px.bar(region_counts, x='Region', y='Number of Stations', color='Region',
-                 title='Number of Stations by Region',
-                 labels={'Number of Stations': 'Number of Stations', 'Region': 'Region'})
+    if center_name != NO_STATION:
+        center = stations_data.loc[stations_data['nom'] == center_name].iloc[0]
+        latitude, longitude = float(center['latitude']), float(center['longitude'])
+        views = get_area_views(category, region, latitude, longitude, radius_km)
+    else:
+        # Filtered chart and map for this combination, rendered once and then served from the render cache
+        views = get_station_views(category, region)
 
-    st.plotly_chart(fig)  # Render the interactive plot
+    with timed("chart display"):
+        st.plotly_chart(pio.from_json(views.figure_json))  # Render the interactive plot
 
     st.subheader("Map of French Railway Stations")
-    st.write(f"Showing {len(filtered_data)} stations in \"{category}\"")
-
-    # Create a folium map based on the filtered data
-    stations_map_filtered = folium.Map(location=[46.603354, 1.888334], zoom_start=6)
-
-    # Add filtered markers to the map
-    for idx, row in filtered_data.iterrows():
-        codeinsee_str = str(row['codeinsee']).zfill(5)
-        department_code = codeinsee_str[:2]
-        region_name = department_to_region.get(department_code, 'Unknown Region')
-        color = region_colors.get(region_name, 'black')
-
-        folium.Marker(
-            location=[row['latitude'], row['longitude']],
-            popup=f"{row['nom']}<br><b>Region:</b> {region_name}",
-            icon=folium.Icon(color=color)
-        ).add_to(stations_map_filtered)
+    st.write(f"Showing {views.station_count} stations in \"{category}\"")
 
     # Render the map
-    folium_static(stations_map_filtered)
+    with timed("map display"):
+        components.html(views.map_html, height=MAP_HEIGHT + 10, width=MAP_WIDTH)
+
+    if center_name != NO_STATION:
+        st.subheader(f"Stations nearest to {center_name}")
+        with timed("nearest stations"):
+            nearest = nearest_stations(stations_data, category, region, latitude, longitude, radius_km)
+        if nearest.empty:
+            st.write(f"No station within {radius_km} km.")
+        else:
+            st.dataframe(nearest.rename(columns={'nom': 'Station', 'segment_drg': 'Category', 'region': 'Region',
+                                                 'distance_km': 'Distance (km)'}))
 
     # Improved legend section
     st.subheader("Légende des couleurs :")
-    for region, color in region_colors.items():
+    for region, color in REGION_COLORS.items():
         st.markdown(f"<span style='color:{color}; font-weight: bold;'>■ {region}</span>", unsafe_allow_html=True)
 
+    # Passenger traffic of the frequentation file, summed in hexagons whose size follows the zoom level
+    st.subheader("Passenger Traffic Density")
+    try:
+        with timed("traffic hexbins"):
+            hexbins = load_traffic_hexbins()
+    except FileNotFoundError:
+        st.write("Frequentation data is not available.")
+    else:
+        years = sorted(hexbins['year'].unique().tolist(), reverse=True)
+        year = st.selectbox("Year", years)
+        density_map = get_density_map(year)
+        st.write(f"Passengers per km² in {year}, over {density_map.hex_count} hexagons of "
+                 f"{HEX_LEVELS[0]['size_km']:g} km at the national scale; zoom in for finer hexagons "
+                 f"(down to {HEX_LEVELS[-1]['size_km']:g} km).")
+        with timed("density map display"):
+            components.html(density_map.map_html, height=MAP_HEIGHT + 10, width=MAP_WIDTH)
+
     st.write("Use the filters on the left to adjust the data displayed on the map and charts.")
 else:
     st.write("No station data available to display.")
+
+# Timing breakdown of this rerun (logged, and shown in the sidebar when profiling is on)
+show_profile()
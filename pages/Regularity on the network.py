@@ -2,18 +2,62 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 
-df = pd.read_csv('./datasets/regularite-mensuelle-tgv-aqst.csv', delimiter=';')
+from track import profiling
+from track.anomalies import ANOMALY_METRICS, find_anomalies, load_anomaly_scores
+from track.profiling import timed
+from track.regularity import cube_totals, load_regularity_cube, slice_cube, summarize_cube
+from track.ui import show_profile
 
-df['date'] = pd.to_datetime(df['date'], errors='coerce')
+profiling.begin("Regularity")
 
-# Visualization 1: Trend of Average Arrival Delays
-df['year_month'] = df['date'].dt.to_period('M')
-monthly_delays = df.groupby('year_month')['retard_moyen_arrivee'].mean().reset_index()
+st.title("TGV Regularity Over the Years")
 
-# Convert 'year_month' to string to avoid serialization issues
-monthly_delays['year_month'] = monthly_delays['year_month'].astype(str)
+# Load the pre-aggregated cube (rebuilt only when the regularity file changes)
+try:
+    cube = load_regularity_cube()
+except FileNotFoundError:
+    st.error("Data file not found.")
+    st.stop()
+
+# Sidebar filters
+st.sidebar.title("TRACK Dashboard")
+st.sidebar.write("Use the options below to filter the regularity data.")
+
+months = cube['month'].drop_duplicates().dt.strftime('%Y-%m').tolist()
+start_month, end_month = st.sidebar.select_slider("Period", options=months, value=(months[0], months[-1]))
+
+service = st.sidebar.selectbox("Service", ['All services'] + sorted(cube['service'].cat.categories))
+origin = st.sidebar.selectbox("Departure station", ['All stations'] + sorted(cube['gare_depart'].cat.categories))
+destination = st.sidebar.selectbox("Arrival station", ['All stations'] + sorted(cube['gare_arrivee'].cat.categories))
+
+filters = {
+    'start': pd.Timestamp(start_month) if start_month != months[0] else None,
+    'end': pd.Timestamp(end_month) if end_month != months[-1] else None,
+    'service': service if service != 'All services' else None,
+    'origin': origin if origin != 'All stations' else None,
+    'destination': destination if destination != 'All stations' else None,
+}
+
+# Sum the matching cube slice (the whole cube without filters)
+with timed("cube slice"):
+    rows = slice_cube(cube, **filters)
+if rows.empty:
+    st.warning("No regularity data for the selected filters.")
+    st.stop()
+with timed("summary"):
+    summary = summarize_cube(rows)
+
+# Headline figures for the selection
+with timed("totals"):
+    totals = cube_totals(rows)
+columns = st.columns(4)
+columns[0].metric("Planned trains", f"{totals['trains_planned']:,}")
+columns[1].metric("Cancelled", f"{totals['cancellation_rate']:.1%}")
+columns[2].metric("Late arrivals", f"{totals['late_arrival_rate']:.1%}")
+columns[3].metric("Mean delay of late trains", f"{totals['mean_late_arrival_delay']:.1f} min")
 
-st.title("TGV Regularity Over the Years")
+# Visualization 1: Trend of Average Arrival Delays
+monthly_delays = summary.monthly_delays
 
 st.subheader("Average Arrival Delay Over Time")
 fig1 = px.line(monthly_delays, x='year_month', y='retard_moyen_arrivee',
@@ -22,14 +66,7 @@ fig1 = px.line(monthly_delays, x='year_month', y='retard_moyen_arrivee',
 st.plotly_chart(fig1)
 
 # Visualization 2: Lines with Most Incidents
-line_incidents = df.groupby(['gare_depart', 'gare_arrivee']).agg({
-    'nb_annulation': 'sum',
-    'nb_train_depart_retard': 'sum',
-    'nb_train_retard_arrivee': 'sum'
-}).reset_index()
-
-# Calculate the total number of incidents (cancellations + delays)
-line_incidents['total_incidents'] = line_incidents['nb_annulation'] + line_incidents['nb_train_depart_retard'] + line_incidents['nb_train_retard_arrivee']
+line_incidents = summary.line_incidents
 
 top_lines = line_incidents.nlargest(10, 'total_incidents').sort_values(by='total_incidents', ascending=True)
 
@@ -49,11 +86,7 @@ st.plotly_chart(fig2)
 
 
 # Visualization 3: Causes of Delays
-cause_columns = [
-    'prct_cause_externe', 'prct_cause_infra', 'prct_cause_gestion_trafic',
-    'prct_cause_materiel_roulant', 'prct_cause_gestion_gare', 'prct_cause_prise_en_charge_voyageurs'
-]
-avg_causes = df[cause_columns].mean()
+avg_causes = summary.average_causes
 
 st.subheader("Average Causes of Train Delays")
 causes_data = pd.DataFrame({
@@ -65,3 +98,48 @@ fig3 = px.pie(causes_data, names='Cause', values='Percentage',
               title="Average Causes of Train Delays",
               hole=0.3)
 st.plotly_chart(fig3)
+
+# Visualization 4: Unusual months per route, scored against each route's previous 12 months
+st.subheader("Unusual Months on the Routes")
+st.write("Months whose value is far from the median of the route's previous 12 months "
+         "(robust z-score of 3.5 or more, spread measured by the median absolute deviation).")
+
+metric_labels = {label: metric for metric, (label, _) in ANOMALY_METRICS.items()}
+metric_label = st.selectbox("Measure", ['All measures'] + list(metric_labels))
+
+with timed("anomalies"):
+    scores = load_anomaly_scores()
+    anomalies = find_anomalies(scores, start=filters['start'], end=filters['end'], service=filters['service'],
+                               origin=filters['origin'], destination=filters['destination'],
+                               metric=metric_labels.get(metric_label))
+
+if anomalies.empty:
+    st.write("No unusual month for the selected filters.")
+else:
+    top_anomalies = anomalies.head(20).assign(
+        Route=lambda rows: rows['gare_depart'].astype(str) + ' -> ' + rows['gare_arrivee'].astype(str),
+        Month=lambda rows: rows['month'].dt.strftime('%Y-%m'),
+        Measure=lambda rows: rows['metric'].map(lambda metric: ANOMALY_METRICS[metric][0]).astype(str),
+    )
+    st.dataframe(top_anomalies[['Route', 'service', 'Month', 'Measure', 'value', 'baseline', 'z_score']].rename(
+        columns={'service': 'Service', 'value': 'Value', 'baseline': 'Baseline (median)', 'z_score': 'Robust z-score'}),
+        hide_index=True)
+    st.write(f"{len(anomalies)} unusual route-months in the selection.")
+
+    # History of the most unusual route and measure, with its baseline and flagged months
+    worst = anomalies.iloc[0]
+    history = scores[(scores['service'] == worst['service'])
+                     & (scores['gare_depart'] == worst['gare_depart'])
+                     & (scores['gare_arrivee'] == worst['gare_arrivee'])
+                     & (scores['metric'] == worst['metric'])]
+    worst_label = ANOMALY_METRICS[worst['metric']][0]
+    fig4 = px.line(history, x='month', y=['value', 'baseline'],
+                   labels={'month': 'Month', 'value': worst_label, 'variable': ''},
+                   title=f"{worst_label}: {worst['gare_depart']} -> {worst['gare_arrivee']}")
+    flagged = history[history['anomaly']]
+    fig4.add_scatter(x=flagged['month'], y=flagged['value'], mode='markers', name='unusual',
+                     marker={'color': 'red', 'size': 9})
+    st.plotly_chart(fig4)
+
+# Timing breakdown of this rerun (logged, and shown in the sidebar when profiling is on)
+show_profile()
@@ -1,35 +1,32 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import os
 
-# Title of the web app
-st.title("TRACK: Train Railway Analytics for Commuter Knowledge")
+from track import profiling
+from track.profiling import timed
+from track.traffic import load_traffic_store
+from track.ui import load_data, show_profile
 
+profiling.begin("Station use")
 
-# Load the dataset with error handling
-@st.cache_data
-def load_data():
-    if not os.path.exists("./datasets/frequentation-gares.csv"):
-        st.error("Data file not found.")
-        return pd.DataFrame()  # Return an empty DataFrame
-    return pd.read_csv("./datasets/frequentation-gares.csv", delimiter=';')
+# Title of the web app
+st.title("TRACK: Train Railway Analytics for Commuter Knowledge")
 
 
-frequentation_data = load_data()
+# Load the dataset
+frequentation_data = load_data("frequentation")
 
 # Show the dataframe
 if not frequentation_data.empty:
-    # Drop rows with NaN values
-    frequentation_data = frequentation_data.dropna()
+    # Passenger counts indexed by station and year, built once per version of the file
+    with timed("traffic store"):
+        traffic = load_traffic_store()
 
     # Sidebar: Filter by category and year
     st.sidebar.title("TRACK Dashboard")
 
     # Add a filter for station categories
-    unique_categories = frequentation_data['segmentation_drg'].str.split(';').explode().unique()
-    unique_categories = [cat for cat in unique_categories if cat in ['A', 'B', 'C']]  # Filter for only A, B, C
-    ordered_categories = ['All categories'] + sorted(unique_categories)
+    ordered_categories = ['All categories'] + traffic.categories()
 
     with st.sidebar.expander("Station Filter"):
         st.sidebar.write("Select a category to filter the stations.")
@@ -47,8 +44,8 @@ if not frequentation_data.empty:
         st.sidebar.write(f"**Meaning of category \"{category}\":**")
         st.sidebar.write(category_meanings[category])
 
-    # Available years for the data
-    available_years = ['2023', '2022', '2021', '2020', '2019', '2018', '2017', '2016', '2015']
+    # Available years for the data, discovered from the dataset columns
+    available_years = traffic.years
 
     with st.sidebar.expander("Year Selection"):
         st.sidebar.write("Select a year to see the top frequented stations.")
@@ -56,25 +53,26 @@ if not frequentation_data.empty:
 
     st.subheader(f"Top 10 of the most frequented stations for the year {selected_year}:")
 
-    # Filter the data based on the selected category
-    filtered_data = frequentation_data if category == 'All categories' else frequentation_data[
-        frequentation_data['segmentation_drg'].str.contains(category)]
+    # Stations matching the selected category
+    station_ids = traffic.station_ids(None if category == 'All categories' else category)
 
-    # Filter and sort the 10 most frequented stations for the selected year
-    top_10_stations = filtered_data[['nom_gare', 'total_voyageurs_' + selected_year]].nlargest(10,
-                                                                                               'total_voyageurs_' + selected_year)
+    # The 10 most frequented stations for the selected year
+    passengers_column = f'total_voyageurs_{selected_year}'
+    with timed("top stations"):
+        top_10_stations = traffic.top_stations(selected_year, station_ids, n=10)
+    top_10_stations = top_10_stations.rename(columns={'passengers': passengers_column})
 
     # Add a rank column
     top_10_stations.insert(0, 'Rank', range(1, len(top_10_stations) + 1))
 
     # Display the interactive table
     st.sidebar.write("### Top 10 Most Frequented Stations")
-    st.sidebar.dataframe(top_10_stations.set_index('Rank'))
+    st.sidebar.dataframe(top_10_stations[['Rank', 'nom_gare', passengers_column]].set_index('Rank'))
 
     # Display an interactive bar chart of the most frequented stations
-    fig = px.bar(top_10_stations, x='nom_gare', y='total_voyageurs_' + selected_year,
+    fig = px.bar(top_10_stations, x='nom_gare', y=passengers_column,
                  title=f"Top 10 stations for {selected_year}:",
-                 labels={'nom_gare': 'Station Name', 'total_voyageurs_' + selected_year: 'Number of Passengers'},
+                 labels={'nom_gare': 'Station Name', passengers_column: 'Number of Passengers'},
                  color_discrete_sequence=['#1f77b4'])  # Custom color for bar
     st.sidebar.plotly_chart(fig)
 
@@ -86,26 +84,23 @@ if not frequentation_data.empty:
         st.write("Compare passenger numbers across different years for selected stations.")
 
         # Choose between pre-COVID and post-COVID years
-        comparison_years = st.multiselect("Select Years to Compare:", available_years, default=['2015', '2021'])
+        default_years = [year for year in (2015, 2021) if year in available_years]
+        comparison_years = st.multiselect("Select Years to Compare:", available_years, default=default_years)
 
         # Select specific stations for comparison
-        station_names = filtered_data['nom_gare'].unique()
-        selected_stations = st.multiselect("Select Stations for Comparison:", station_names,
-                                           default=top_10_stations['nom_gare'].tolist())  # Default stations
+        selected_stations = st.multiselect("Select Stations for Comparison:", station_ids,
+                                           default=top_10_stations['station_id'].tolist(),  # Default stations
+                                           format_func=traffic.station_name)
 
         if selected_stations and comparison_years:
-            comparison_data = filtered_data[
-                ['nom_gare'] + ['total_voyageurs_' + year for year in comparison_years]].copy()
-
-            # Filter for selected stations
-            comparison_data = comparison_data[comparison_data['nom_gare'].isin(selected_stations)]
-
-            # Melt the DataFrame for easier plotting
-            comparison_data = comparison_data.melt(id_vars=['nom_gare'], var_name='Year', value_name='Total Passengers')
+            with timed("comparison"):
+                comparison_data = traffic.compare(selected_stations, comparison_years)
+            comparison_data = comparison_data.rename(columns={'year': 'Year', 'passengers': 'Total Passengers'})
 
             # Convert Year to a categorical type to control order
-            comparison_data['Year'] = comparison_data['Year'].str.replace('total_voyageurs_', '')
-            comparison_data['Year'] = pd.Categorical(comparison_data['Year'], categories=comparison_years, ordered=True)
+            comparison_data['Year'] = pd.Categorical(comparison_data['Year'].astype(str),
+                                                     categories=[str(year) for year in comparison_years],
+                                                     ordered=True)
 
             # Sort the data by Year
             comparison_data.sort_values('Year', inplace=True)
@@ -124,18 +119,19 @@ if not frequentation_data.empty:
     # Yearly Passenger Trends Section
     with st.expander("Yearly Trends"):
         st.write("Analyze passenger trends for a selected station over the years.")
-        selected_station_trend = st.selectbox("Select a Station for Trend Analysis:", station_names)
-        trend_data = filtered_data[filtered_data['nom_gare'] == selected_station_trend]
+        selected_station_trend = st.selectbox("Select a Station for Trend Analysis:", station_ids,
+                                              format_func=traffic.station_name)
+        station_name = traffic.station_name(selected_station_trend)
 
-        # Prepare the data for plotting
-        trend_data = trend_data.melt(id_vars=['nom_gare'],
-                                     value_vars=[f'total_voyageurs_{year}' for year in available_years],
-                                     var_name='Year', value_name='Total Passengers')
-        trend_data['Year'] = trend_data['Year'].str.replace('total_voyageurs_', '')
+        # Prepare the data for plotting (most recent year first, as in the year selection)
+        with timed("trend"):
+            trend_data = traffic.trend(selected_station_trend).sort_values('year', ascending=False)
+        trend_data = trend_data.rename(columns={'year': 'Year', 'passengers': 'Total Passengers'})
+        trend_data['Year'] = trend_data['Year'].astype(str)
 
         # Plotting the line chart
         line_fig = px.line(trend_data, x='Year', y='Total Passengers',
-                           title=f"Passenger Trends for {selected_station_trend} Station:",
+                           title=f"Passenger Trends for {station_name} Station:",
                            labels={'Total Passengers': 'Number of Passengers', 'Year': 'Year'},
                            markers=True)  # Adding markers for better visibility
         st.plotly_chart(line_fig)
@@ -144,3 +140,6 @@ if not frequentation_data.empty:
     st.markdown("""
         **Data Source:** This data is sourced from SNCF and contains information about passenger frequency at various train stations in France.
     """)
+
+# Timing breakdown of this rerun (logged, and shown in the sidebar when profiling is on)
+show_profile()
@@ -1,5 +1,6 @@
 import streamlit as st
-import base64
+
+from track.assets import data_uri, file_bytes
 
 # Setting up the page title and icon
 st.set_page_config(page_title="Riccardo Daffara Portfolio", page_icon=":trophy:", layout="wide")
@@ -15,12 +16,8 @@ def header():
     This portfolio highlights some of my projects, skills, and achievements.
     """)
 
-    # Load and display profile picture
-    with open("pages/pp.png", "rb") as file:
-        img_data = file.read()
-
-    # Encodage de l'image en base64 pour pouvoir l'injecter dans du HTML
-    img_base64 = base64.b64encode(img_data).decode()
+    # Load and display profile picture, encoded in base64 (once per process) to be injected in the HTML
+    img_uri = data_uri("pages/pp.png")
 
     st.markdown(
         f"""
@@ -35,21 +32,20 @@ def header():
             object-fit: cover;
         }}
         </style>
-        <img src="data:image/jpeg;base64,{img_base64}" class="img-circle">
+        <img src="{img_uri}" class="img-circle">
         """,
         unsafe_allow_html=True
     )
 
     # Adding the CV download button
     st.markdown("<h3 style='text-align: center;'>Riccardo DAFFARA</h3>", unsafe_allow_html=True)
-    with open("pages/CV_DAFFARA_1024.pdf", "rb") as cv_file:  # Replace with your actual CV file path
-        cv_data = cv_file.read()
-        st.download_button(
-            label="📄 Download CV",
-            data=cv_data,
-            file_name="Riccardo_Daffara_CV.pdf",  # The name of the downloaded file
-            mime="application/pdf"
-        )
+    cv_data = file_bytes("pages/CV_DAFFARA_1024.pdf")  # Replace with your actual CV file path
+    st.download_button(
+        label="📄 Download CV",
+        data=cv_data,
+        file_name="Riccardo_Daffara_CV.pdf",  # The name of the downloaded file
+        mime="application/pdf"
+    )
 
 
 # About Me Section
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from track.anomalies import _build_anomaly_scores, find_anomalies
+from track.regularity import COUNT_COLUMNS
+
+MONTHS = pd.date_range('2022-01-01', periods=24, freq='MS')
+OUTLIERS = {'National': MONTHS[18], 'International': MONTHS[20]}
+
+
+# One route run by two services for two years: 200 trains a month, a steady 5 min mean delay and 1%
+# cancellations with some noise, and one month of each service ten times more delayed
+def _cube():
+    rng = np.random.default_rng(0)
+    rows = []
+    for service, outlier in OUTLIERS.items():
+        for month in MONTHS:
+            delay = 50.0 if month == outlier else 5 + rng.normal(0, 0.3)
+            rows.append({'service': service, 'gare_depart': 'PARIS LYON', 'gare_arrivee': 'MARSEILLE ST CHARLES',
+                         'month': month, 'nb_train_prevu': 200, 'nb_annulation': 2 + int(rng.integers(0, 2)),
+                         'delay_sum': delay * 195, 'delay_count': 195})
+    cube = pd.DataFrame(rows)
+    for column in COUNT_COLUMNS[2:]:
+        cube[column] = 10
+    return cube
+
+
+def test_outliers_are_flagged_under_their_own_service():
+    scores = _build_anomaly_scores(_cube())
+    for service, outlier in OUTLIERS.items():
+        flagged = find_anomalies(scores, service=service)
+        assert set(flagged['month']) == {outlier}
+        assert set(flagged['metric']) == {'mean_delay'}
+        assert (flagged['service'] == service).all()
+
+    assert set(find_anomalies(scores)['month']) == set(OUTLIERS.values())
+    assert find_anomalies(scores, service='National', start=OUTLIERS['International']).empty
@@ -0,0 +1,54 @@
+import asyncio
+import json
+
+import pytest
+
+from track import api
+
+
+# Status and decoded body of a GET through the ASGI application
+def get(path, query=''):
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(), 'headers': []}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request'}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(api.app(scope, receive, send))
+    return messages[0]['status'], json.loads(messages[1]['body'] or b'null')
+
+
+@pytest.mark.parametrize('path, query', [
+    ('/stations', 'category=Z'),
+    ('/stations', 'region=Atlantis'),
+    ('/stations/nearest', 'latitude=45.76&longitude=4.86&category=Z'),
+    ('/stations/nearest', 'latitude=45.76&longitude=4.86&region=Atlantis'),
+    ('/stations/nearest', 'latitude=45.76&longitude=4.86&k=0'),
+    ('/stations/nearest', 'latitude=45.76&longitude=4.86&k=-3'),
+    ('/stations/nearest', 'latitude=45.76&longitude=4.86&radius_km=-5'),
+    ('/stations/nearest', 'latitude=nan&longitude=4.86'),
+    ('/stations/nearest', 'latitude=45.76&longitude=inf'),
+    ('/stations/nearest', 'latitude=-inf&longitude=4.86'),
+    ('/traffic/top', 'category=Q'),
+    ('/traffic/top', 'n=0'),
+    ('/traffic/top', 'n=-5'),
+    ('/regularity/anomalies', 'n=-1'),
+    ('/od', 'n=0'),
+])
+def test_invalid_parameters_are_bad_requests(path, query):
+    status, body = get(path, query)
+    assert status == 400
+    assert 'must be' in body['error']
+
+
+def test_valid_filters_are_accepted():
+    status, body = get('/stations', 'category=A&region=Bretagne')
+    assert status == 200
+    assert body and all(row['region'] == 'Bretagne' for row in body)
+
+    status, body = get('/traffic/top', 'category=All categories&n=3')
+    assert status == 200
+    assert len(body) == 3
@@ -0,0 +1,31 @@
+import threading
+import time
+
+import pandas as pd
+
+from track import data
+
+
+# Without fcntl (Windows), threads asking for the same missing table still build it once
+def test_derived_table_is_built_once_without_file_locks(tmp_path, monkeypatch):
+    monkeypatch.setattr(data, 'fcntl', None)
+    monkeypatch.setattr(data, 'CACHE_DIR', tmp_path)
+    monkeypatch.setattr(data, '_loaded', {})
+    builds = []
+
+    def build(previous):
+        builds.append(threading.get_ident())
+        time.sleep(0.2)
+        return pd.DataFrame({'value': [1, 2, 3]})
+
+    tables = []
+    threads = [threading.Thread(target=lambda: tables.append(data.load_derived("test_table", ["stations"], build)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert len(tables) == 4 and all(table['value'].tolist() == [1, 2, 3] for table in tables)
+    assert not list(tmp_path.glob('*.tmp'))
@@ -0,0 +1,59 @@
+import pandas as pd
+
+from track.distances import DESTINATION_UIC, ORIGIN_UIC
+from track.entities import MIN_NAME_SCORE, _build_station_entities, normalize_name
+
+STATIONS = pd.DataFrame({
+    'nom': ['Paris Montparnasse', 'Bordeaux Saint-Jean', 'Paris Gare de Lyon', 'Lyon Part Dieu'],
+    'codes_uic': ['87391003;87391102', '87581009', '87686006', '87723197'],
+})
+FREQUENTATION = pd.DataFrame({'code_uic_complet': [87391003, 87723197],
+                              'nom_gare': ['Paris Montparnasse', 'Lyon Part-Dieu']})
+# Geneva is a foreign station: its UIC code is not in the stations file
+PRICES = pd.DataFrame({
+    'Gare origine': ['PARIS MONTPARNASSE 1 ET 2', 'PARIS GARE DE LYON'], ORIGIN_UIC: [87391102, 87686006],
+    'Destination': ['BORDEAUX ST JEAN', 'GENEVE'], DESTINATION_UIC: [87581009, 85010082],
+})
+REGULARITY = pd.DataFrame({
+    'gare_depart': ['PARIS MONTPARNASSE', 'PARIS LYON', 'LYON PART DIEU TGV', 'LYON PERRACHE'],
+    'gare_arrivee': ['BORDEAUX ST JEAN', 'GENEVE', 'PARIS LYON', 'PARIS LYON'],
+})
+
+
+def _entities():
+    return _build_station_entities(STATIONS, FREQUENTATION, PRICES, REGULARITY)
+
+
+def test_normalize_name():
+    assert normalize_name("Saint-Pierre-des-Corps") == normalize_name("ST PIERRE DES CORPS")
+    assert normalize_name("Genève") == "GENEVE"
+
+
+def test_coded_records_resolve_to_the_first_uic_code():
+    coded = _entities().query("dataset != 'regularity'").set_index(['dataset', 'key'])['station_id']
+    assert coded[('stations', '87391003;87391102')] == 87391003
+    assert coded[('frequentation', '87391003')] == 87391003
+    # Second code of the station
+    assert coded[('prices', '87391102')] == 87391003
+    # Foreign station: its own code
+    assert coded[('prices', '85010082')] == 85010082
+
+
+def test_regularity_names_match_table():
+    regularity = _entities().query("dataset == 'regularity'").set_index('key')
+    matches = regularity[['station_id', 'method']].astype({'method': str})
+    expected = pd.DataFrame.from_dict({
+        # Same normalized name
+        'BORDEAUX ST JEAN': (87581009, 'name'),
+        'PARIS MONTPARNASSE': (87391003, 'name'),
+        'GENEVE': (85010082, 'name'),
+        # Close spelling, above the threshold
+        'LYON PART DIEU TGV': (87723197, 'name'),
+        'PARIS LYON': (87686006, 'alias'),
+        # Shares "LYON" with Lyon Part Dieu, below the threshold
+        'LYON PERRACHE': (-1, 'unmatched'),
+    }, orient='index', columns=['station_id', 'method'])
+    pd.testing.assert_frame_equal(matches.sort_index(), expected.sort_index(), check_names=False)
+
+    assert regularity.loc['LYON PART DIEU TGV', 'score'] >= MIN_NAME_SCORE
+    assert 0 < regularity.loc['LYON PERRACHE', 'score'] < MIN_NAME_SCORE
@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+
+from track import data
+from track.ingest import ingest
+from track.regularity import load_regularity_cube
+
+REGULARITY = data.DATASETS['regularity'].filename
+
+
+# Datasets folder and cache directory of their own, with the regularity file cut before its last month,
+# which is written as a drop. The other datasets are links to the checked-in files.
+@pytest.fixture
+def drop(tmp_path, monkeypatch):
+    datasets, cache = tmp_path / 'datasets', tmp_path / 'cache'
+    datasets.mkdir()
+    # Several datasets can read the same file (frequentation and traffic)
+    for filename in {dataset.filename for dataset in data.DATASETS.values()} - {REGULARITY}:
+        if (data.DATASETS_DIR / filename).exists():
+            (datasets / filename).symlink_to((data.DATASETS_DIR / filename).resolve())
+
+    raw = pd.read_csv(data.DATASETS['regularity'].path, sep=';', dtype=str, keep_default_na=False,
+                      encoding='utf-8-sig')
+    last = raw['date'] == raw['date'].max()
+    raw[~last].to_csv(datasets / REGULARITY, sep=';', index=False)
+    raw[last].to_csv(tmp_path / 'drop.csv', sep=';', index=False)
+
+    monkeypatch.setenv('TRACK_CACHE_DIR', str(cache))
+    monkeypatch.setattr(data, 'DATASETS_DIR', datasets)
+    monkeypatch.setattr(data, 'CACHE_DIR', cache)
+    monkeypatch.setattr(data, '_loaded', {})
+    return tmp_path / 'drop.csv'
+
+
+def test_ingested_month_matches_a_full_rebuild(drop):
+    before = load_regularity_cube()
+    assert ingest('regularity', drop)
+    incremental = load_regularity_cube()
+    assert incremental['month'].max() > before['month'].max()
+
+    # Same source, built from scratch
+    for path in data.CACHE_DIR.glob('*.arrow'):
+        path.unlink()
+    data._loaded.clear()
+    rebuilt = load_regularity_cube()
+    pd.testing.assert_frame_equal(incremental, rebuilt)
+
+    assert not ingest('regularity', drop)
@@ -0,0 +1,72 @@
+import json
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from track.distances import haversine_km
+from track.network import RailNetwork, _build_graph, _undirected_edges
+
+
+# Two routes from station 1 to station 4 (via node 1: 1 + 1 km, via node 2: 0.5 + 2 km) and a station
+# on an isolated node. Nodes are a few hundred meters apart, so edge lengths stay above the great-circle
+# distances used by the A* heuristic.
+@pytest.fixture
+def network():
+    nodes = pd.DataFrame({'latitude': [45.0, 45.002, 44.998, 45.0, 46.0],
+                          'longitude': [2.0, 2.002, 2.002, 2.004, 2.0]})
+    edges = _undirected_edges(np.array([0, 1, 0, 2]), np.array([1, 3, 2, 3]), np.array([1.0, 1.0, 0.5, 2.0]))
+    stations = pd.DataFrame({'uic': [1, 2, 3, 4, 5], 'node': [0, 1, 2, 3, 4]})
+    return RailNetwork(nodes, edges, stations)
+
+
+def test_shortest_path(network):
+    km, path = network.shortest_path(1, 4)
+    assert km == pytest.approx(2.0)
+    assert path == [0, 1, 3]
+    assert network.shortest_path(1, 1) == (0.0, [0])
+
+
+def test_unreachable_and_unknown_stations(network):
+    for origin, destination in [(1, 5), (5, 1), (1, 99), (99, 1)]:
+        km, path = network.shortest_path(origin, destination)
+        assert math.isnan(km) and path == []
+
+
+def test_distances_from(network):
+    distances = network.distances_from(1, [2, 3, 4, 5, 99])
+    assert distances[2] == pytest.approx(1.0)
+    assert distances[3] == pytest.approx(0.5)
+    assert distances[4] == pytest.approx(2.0)
+    assert math.isnan(distances[5]) and math.isnan(distances[99])
+    assert all(math.isnan(km) for km in network.distances_from(99, [1, 2]).values())
+
+
+def _line(*coordinates):
+    return json.dumps({'type': 'LineString', 'coordinates': [list(point) for point in coordinates]})
+
+
+# A main line in two sections with a branch at their junction, and a separate line far from them
+def test_graph_from_lines():
+    lines = pd.DataFrame({'geometry': [
+        _line((0.0, 45.0), (0.05, 45.0), (0.1, 45.0)),
+        _line((0.1, 45.0), (0.15, 45.0), (0.2, 45.0)),
+        _line((0.1, 45.0), (0.1, 45.05), (0.1, 45.1)),
+        _line((3.0, 47.0), (3.1, 47.0)),
+    ]})
+    stations = pd.DataFrame({
+        'codes_uic': ['1', '2;22', '3', '4', '5'],
+        # Station 1 is ~110 m off the line, station 5 far from every line
+        'latitude': [45.001, 45.0, 45.1, 47.0, 50.0],
+        'longitude': [0.0, 0.2, 0.1, 3.0, 10.0],
+    })
+    network = RailNetwork(*_build_graph(lines, stations))
+
+    assert {1, 2, 22, 3, 4} <= set(network.station_nodes) and 5 not in network
+    assert network.station_nodes[2] == network.station_nodes[22]
+
+    assert network.shortest_path(1, 2)[0] == pytest.approx(haversine_km(45.0, 0.0, 45.0, 0.2), rel=1e-3)
+    expected = haversine_km(45.0, 0.0, 45.0, 0.1) + haversine_km(45.0, 0.1, 45.1, 0.1)
+    assert network.shortest_path(1, 3)[0] == pytest.approx(expected, rel=1e-3)
+    assert math.isnan(network.shortest_path(1, 4)[0])
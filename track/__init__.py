@@ -0,0 +1 @@
+# Shared code for the TRACK pages: data access, caches and analytics engines.
@@ -0,0 +1,117 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from track.data import load_derived
+from track.regularity import COUNT_COLUMNS, load_regularity_cube
+
+# Measures monitored for every route and month: label, and the smallest spread used as the z-score scale so
+# that months of a perfectly steady route do not stand out for a tiny change
+ANOMALY_METRICS = {
+    'mean_delay': ('Mean arrival delay (min)', 2.0),
+    'cancellation_rate': ('Cancellation rate', 0.02),
+    'late_15_share': ('Share of trains over 15 min late', 0.02),
+    'late_30_share': ('Share of trains over 30 min late', 0.01),
+    'late_60_share': ('Share of trains over 60 min late', 0.01),
+}
+
+# Route-months with fewer scheduled trains are left out: a handful of trains makes every rate jump
+MIN_TRAINS = 30
+
+# A month is compared with the median of the route's previous BASELINE_MONTHS months, when at least
+# MIN_BASELINE_MONTHS of them have data
+BASELINE_MONTHS = 12
+MIN_BASELINE_MONTHS = 6
+
+# Robust z-score from which a route-month is flagged (Iglewicz and Hoaglin)
+Z_THRESHOLD = 3.5
+
+# MAD of a normal distribution times this factor estimates its standard deviation
+_MAD_TO_SD = 1.4826
+
+# Series scored separately: a route served under two services gets one series per service, so the
+# service filter of the page selects exactly the trains behind each score
+ROUTE_KEYS = ['service', 'gare_depart', 'gare_arrivee']
+
+
+# Monitored measures as a (metric, route, month) array over every month of the period, NaN where a route
+# has no data that month, with the (service, route) index and the months of its axes
+def route_month_matrix(cube):
+    sums = cube.groupby(ROUTE_KEYS + ['month'], observed=True)[COUNT_COLUMNS + ['delay_sum', 'delay_count']].sum()
+    sums = sums[sums['nb_train_prevu'] >= MIN_TRAINS]
+    # Rates are per scheduled train: the late counts of the source sometimes exceed the trains that ran
+    planned = sums['nb_train_prevu']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        measures = pd.DataFrame({
+            'mean_delay': sums['delay_sum'] / sums['delay_count'],
+            'cancellation_rate': sums['nb_annulation'] / planned,
+            'late_15_share': sums['nb_train_retard_sup_15'] / planned,
+            'late_30_share': sums['nb_train_retard_sup_30'] / planned,
+            'late_60_share': sums['nb_train_retard_sup_60'] / planned,
+        }).replace([np.inf, -np.inf], np.nan)
+
+    months = pd.date_range(cube['month'].min(), cube['month'].max(), freq='MS')
+    wide = measures.unstack('month').reindex(columns=pd.MultiIndex.from_product([list(ANOMALY_METRICS), months]))
+    values = wide.to_numpy(dtype='float64').reshape(len(wide), len(ANOMALY_METRICS), len(months))
+    return values.transpose(1, 0, 2), wide.index, months
+
+
+# Median and MAD of the `window` months before each month, along the last axis, for all series at once.
+# The baseline is NaN where fewer than `min_periods` of those months have data.
+def rolling_baseline(values, window=BASELINE_MONTHS, min_periods=MIN_BASELINE_MONTHS):
+    padded = np.concatenate([np.full(values.shape[:-1] + (window,), np.nan), values[..., :-1]], axis=-1)
+    windows = sliding_window_view(padded, window, axis=-1)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # All-NaN windows
+        median = np.nanmedian(windows, axis=-1)
+        mad = np.nanmedian(np.abs(windows - median[..., None]), axis=-1)
+    too_short = np.sum(~np.isnan(windows), axis=-1) < min_periods
+    median[too_short] = np.nan
+    mad[too_short] = np.nan
+    return median, mad
+
+
+# One row per (route, month, metric) with data: the value, its baseline and robust z-score, and whether it
+# is flagged as anomalous
+def _build_anomaly_scores(cube):
+    values, routes, months = route_month_matrix(cube)
+    baseline, mad = rolling_baseline(values)
+    min_scale = np.array([scale for _, scale in ANOMALY_METRICS.values()])[:, None, None]
+    with np.errstate(invalid='ignore'):
+        z = (values - baseline) / np.fmax(_MAD_TO_SD * mad, min_scale)
+
+    metric, route, month = np.nonzero(~np.isnan(values))
+    scores = pd.DataFrame({
+        'service': routes.get_level_values('service')[route].astype(str),
+        'gare_depart': routes.get_level_values('gare_depart')[route].astype(str),
+        'gare_arrivee': routes.get_level_values('gare_arrivee')[route].astype(str),
+        'month': months[month],
+        'metric': pd.Categorical.from_codes(metric, categories=list(ANOMALY_METRICS)),
+        'value': values[metric, route, month],
+        'baseline': baseline[metric, route, month],
+        'z_score': z[metric, route, month].astype('float32'),
+    })
+    scores['anomaly'] = np.abs(scores['z_score']) >= Z_THRESHOLD
+    return scores.astype({'service': 'category', 'gare_depart': 'category', 'gare_arrivee': 'category'})
+
+
+def load_anomaly_scores():
+    return load_derived("regularity_anomalies", ["regularity"],
+                        lambda previous: _build_anomaly_scores(load_regularity_cube()), version=2)
+
+
+# Flagged route-months within the filters, the largest deviations first
+def find_anomalies(scores, start=None, end=None, service=None, origin=None, destination=None, metric=None):
+    mask = scores['anomaly'].to_numpy().copy()
+    if start is not None:
+        mask &= (scores['month'] >= start).to_numpy()
+    if end is not None:
+        mask &= (scores['month'] <= end).to_numpy()
+    for column, value in (('service', service), ('gare_depart', origin), ('gare_arrivee', destination),
+                          ('metric', metric)):
+        if value is not None:
+            mask &= (scores[column] == value).to_numpy()
+    flagged = scores[mask]
+    return flagged.iloc[np.argsort(-np.abs(flagged['z_score'].to_numpy()), kind='stable')]
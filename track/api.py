@@ -0,0 +1,353 @@
+# Headless JSON API over the same cached tables as the dashboard, as a plain ASGI application:
+#
+#   python -m track.api --port 8600                  # needs an ASGI server: pip install uvicorn
+#   uvicorn track.api:app --workers 4                # several processes share the cache directory
+#
+#   GET /datasets
+#   GET /stations?category=A&region=Bretagne
+#   GET /stations/nearest?latitude=45.76&longitude=4.86&radius_km=25&k=10
+#   GET /traffic/top?year=2023&category=A&n=10
+#   GET /traffic/trend?station_id=87723197
+#   GET /prices/destinations?origin=PARIS GARE DE LYON
+#   GET /prices/route?origin=PARIS GARE DE LYON&destination=MARSEILLE ST CHARLES
+#   GET /regularity/monthly?start=2022-01&end=2023-12&service=National&origin=PARIS LYON
+#   GET /regularity/anomalies?service=National&origin=PARIS LYON&metric=mean_delay&n=20
+#   GET /od?origin_id=87686030&destination_id=87751008
+#
+# Every response carries an ETag derived from the path, the query and the hashes of the source files the
+# endpoint reads, so it is known before anything is computed: a matching If-None-Match is answered 304 at
+# once, and repeated queries are served from an LRU of encoded responses. Concurrent requests for the same
+# uncached response wait for a single computation, which runs in a worker thread.
+import argparse
+import asyncio
+import hashlib
+import inspect
+import json
+import math
+import sys
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qsl
+
+import numpy as np
+import pandas as pd
+
+from track.anomalies import ANOMALY_METRICS, find_anomalies, load_anomaly_scores
+from track.data import DATASETS, dataset_hash, load_dataset
+from track.entities import load_od_facts
+from track.prices import load_route_index
+from track.regularity import cube_totals, load_regularity_cube, slice_cube, summarize_cube
+from track.segments import SEGMENTS
+from track.station_views import (ALL_CATEGORIES, ALL_REGIONS, filter_stations, nearest_stations,
+                                 station_regions)
+from track.traffic import load_traffic_store
+
+# Encoded responses kept per process
+MAX_CACHED_RESPONSES = 512
+
+# Handlers by path: (function of the query parameters, datasets the result depends on)
+ENDPOINTS = {}
+
+_responses = OrderedDict()
+_responses_lock = threading.Lock()
+_pending = {}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class NotFound(LookupError):
+    pass
+
+
+# Decorator registering a handler; it receives the query parameters as keyword arguments (strings, or
+# None when absent) and returns a JSON-serializable value, DataFrames included
+def endpoint(path, sources):
+    def decorator(handler):
+        ENDPOINTS[path] = (handler, sources)
+        return handler
+
+    return decorator
+
+
+def _number(value, name, kind=float, default=None, minimum=None):
+    if value is None:
+        if default is None:
+            raise BadRequest(f"Missing parameter: {name}")
+        return default
+    try:
+        number = kind(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a number") from None
+    if not math.isfinite(number):
+        raise BadRequest(f"{name} must be a finite number")
+    if minimum is not None and number < minimum:
+        raise BadRequest(f"{name} must be at least {minimum}")
+    return number
+
+
+# Row counts (k, n) of the endpoints: positive integers
+def _count(value, name, default):
+    return _number(value, name, int, default=default, minimum=1)
+
+
+def _choice(value, name, choices):
+    if value not in choices:
+        raise BadRequest(f"{name} must be one of {', '.join(map(str, choices))}")
+    return value
+
+
+# Station filters of the stations endpoints, checked against the categories and the regions of the file
+def _station_filters(stations, category, region):
+    return (_choice(category, 'category', [ALL_CATEGORIES, *SEGMENTS]),
+            _choice(region, 'region', station_regions(stations)))
+
+
+def _month(value, name):
+    if value is None:
+        return None
+    try:
+        return pd.Period(value, freq='M').start_time
+    except ValueError:
+        raise BadRequest(f"{name} must be a month such as 2023-06") from None
+
+
+# JSON-ready copy of a handler result: DataFrames become lists of records, NaN becomes null
+def _plain(value):
+    if isinstance(value, pd.DataFrame):
+        return json.loads(value.to_json(orient='records', date_format='iso', force_ascii=False))
+    if isinstance(value, dict):
+        return {str(key): _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if hasattr(value, 'item'):  # NumPy scalars
+        return _plain(value.item())
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Endpoints
+# ---------------------------------------------------------------------------
+
+@endpoint("/datasets", sources=list(DATASETS))
+def datasets():
+    return [{'name': name, 'file': dataset.filename, 'description': dataset.description,
+             'available': dataset.path.exists(),
+             'hash': dataset_hash(name) if dataset.path.exists() else None}
+            for name, dataset in DATASETS.items()]
+
+
+STATION_COLUMNS = ['nom', 'libellecourt', 'codes_uic', 'segment_drg', 'department', 'region', 'latitude',
+                   'longitude']
+
+
+@endpoint("/stations", sources=["stations"])
+def stations(category=ALL_CATEGORIES, region=ALL_REGIONS):
+    data = load_dataset("stations")
+    return filter_stations(data, *_station_filters(data, category, region))[STATION_COLUMNS]
+
+
+@endpoint("/stations/nearest", sources=["stations"])
+def nearest(latitude=None, longitude=None, radius_km=None, k=None, category=ALL_CATEGORIES, region=ALL_REGIONS):
+    data = load_dataset("stations")
+    return nearest_stations(data, *_station_filters(data, category, region), _number(latitude, 'latitude'),
+                            _number(longitude, 'longitude'), _number(radius_km, 'radius_km', default=25.0, minimum=0),
+                            k=_count(k, 'k', default=10))
+
+
+@endpoint("/traffic/top", sources=["frequentation"])
+def top_stations(year=None, category=None, n=None):
+    store = load_traffic_store()
+    year = _number(year, 'year', int, default=store.years[0])
+    if year not in store.years:
+        raise NotFound(f"No traffic for {year}; years: {store.years}")
+    if category is not None and _choice(category, 'category', [ALL_CATEGORIES, *SEGMENTS]) == ALL_CATEGORIES:
+        category = None
+    station_ids = store.station_ids(category) if category is not None else None
+    return store.top_stations(year, station_ids, n=_count(n, 'n', default=10))
+
+
+@endpoint("/traffic/trend", sources=["frequentation"])
+def traffic_trend(station_id=None):
+    store = load_traffic_store()
+    station_id = _number(station_id, 'station_id', int)
+    if station_id not in store.stations.index:
+        raise NotFound(f"Unknown station_id: {station_id}")
+    return {'station_id': station_id, 'nom_gare': store.station_name(station_id),
+            'years': store.trend(station_id)}
+
+
+@endpoint("/prices/destinations", sources=["prices"])
+def destinations(origin=None):
+    index = load_route_index("prices")
+    if origin is None:
+        return index.origins
+    if origin not in index.destinations:
+        raise NotFound(f"Unknown origin: {origin}")
+    return index.destinations[origin]
+
+
+@endpoint("/prices/route", sources=["prices"])
+def route_prices(origin=None, destination=None):
+    if origin is None or destination is None:
+        raise BadRequest("origin and destination are required")
+    index = load_route_index("prices")
+    if (origin, destination) not in index:
+        raise NotFound(f"No fares from {origin} to {destination}")
+    return {'origin': origin, 'destination': destination, 'fares': index.route_summary(origin, destination)}
+
+
+@endpoint("/regularity/monthly", sources=["regularity"])
+def monthly_regularity(start=None, end=None, service=None, origin=None, destination=None):
+    rows = slice_cube(load_regularity_cube(), _month(start, 'start'), _month(end, 'end'), service, origin,
+                      destination)
+    if rows.empty:
+        raise NotFound("No regularity data for these filters")
+    return {'totals': cube_totals(rows), 'monthly_delays': summarize_cube(rows).monthly_delays}
+
+
+@endpoint("/regularity/anomalies", sources=["regularity"])
+def anomalies(start=None, end=None, service=None, origin=None, destination=None, metric=None, n=None):
+    if metric is not None and metric not in ANOMALY_METRICS:
+        raise BadRequest(f"metric must be one of {', '.join(ANOMALY_METRICS)}")
+    flagged = find_anomalies(load_anomaly_scores(), _month(start, 'start'), _month(end, 'end'), service, origin,
+                             destination, metric)
+    return flagged.head(_count(n, 'n', default=50)).astype({'metric': str, 'service': str, 'gare_depart': str,
+                                                           'gare_arrivee': str})
+
+
+@endpoint("/od", sources=["stations", "frequentation", "prices", "regularity", "railway_lines"])
+def od(origin_id=None, destination_id=None, n=None):
+    facts = load_od_facts()
+    mask = np.ones(len(facts), dtype=bool)
+    if origin_id is not None:
+        mask &= (facts['origin_id'] == _number(origin_id, 'origin_id', int)).to_numpy()
+    if destination_id is not None:
+        mask &= (facts['destination_id'] == _number(destination_id, 'destination_id', int)).to_numpy()
+    return facts[mask].head(_count(n, 'n', default=500))
+
+
+# ---------------------------------------------------------------------------
+# ASGI application
+# ---------------------------------------------------------------------------
+
+# Missing optional sources (the line geometries) hash to None; handlers needing a missing file raise
+# FileNotFoundError themselves
+def _etag(path, params, sources):
+    hashes = [dataset_hash(source) if DATASETS[source].path.exists() else None for source in sources]
+    key = json.dumps([path, sorted(params.items()), hashes])
+    return '"' + hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + '"'
+
+
+def _render(path, params):
+    handler, _ = ENDPOINTS[path]
+    return json.dumps(_plain(handler(**params)), ensure_ascii=False, allow_nan=False).encode()
+
+
+def _cached(etag):
+    with _responses_lock:
+        if etag in _responses:
+            _responses.move_to_end(etag)
+            return _responses[etag]
+    return None
+
+
+def _remember(etag, body):
+    with _responses_lock:
+        _responses[etag] = body
+        while len(_responses) > MAX_CACHED_RESPONSES:
+            _responses.popitem(last=False)
+
+
+def _rendered(etag, task):
+    del _pending[etag]
+    if not task.cancelled() and task.exception() is None:
+        _remember(etag, task.result())
+
+
+# Encoded response for an ETag, computed at most once at a time per ETag across concurrent requests
+async def _response_body(etag, path, params):
+    body = _cached(etag)
+    if body is not None:
+        return body
+    task = _pending.get(etag)
+    if task is None:
+        task = asyncio.ensure_future(asyncio.to_thread(_render, path, params))
+        _pending[etag] = task
+        task.add_done_callback(lambda done: _rendered(etag, done))
+    return await asyncio.shield(task)
+
+
+def _error(message):
+    return json.dumps({'error': message}, ensure_ascii=False).encode()
+
+
+# Status, body and extra headers of the response to a GET of `path`
+async def _respond(path, params, request_headers):
+    try:
+        inspect.signature(ENDPOINTS[path][0]).bind(**params)
+    except TypeError:
+        raise BadRequest(f"Unexpected parameters: {', '.join(sorted(params))}") from None
+
+    etag = _etag(path, params, ENDPOINTS[path][1])
+    headers = [(b'etag', etag.encode()), (b'cache-control', b'no-cache')]
+    if etag.encode() in [tag.strip() for tag in request_headers.get(b'if-none-match', b'').split(b',')]:
+        return 304, b'', headers
+    return 200, await _response_body(etag, path, params), headers
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    path = scope['path'].rstrip('/') or '/'
+    headers = []
+    if path not in ENDPOINTS:
+        status, body = 404, _error(f"Unknown endpoint; available: {', '.join(ENDPOINTS)}")
+    elif scope['method'] not in ('GET', 'HEAD'):
+        status, body, headers = 405, _error("Only GET is supported"), [(b'allow', b'GET, HEAD')]
+    else:
+        params = dict(parse_qsl(scope['query_string'].decode('latin-1')))
+        try:
+            status, body, headers = await _respond(path, params, dict(scope['headers']))
+        except BadRequest as error:
+            status, body = 400, _error(str(error))
+        except NotFound as error:
+            status, body = 404, _error(str(error))
+        except FileNotFoundError as error:
+            status, body = 503, _error(f"Data file not found: {error}")
+
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json; charset=utf-8'),
+                            (b'content-length', str(len(body)).encode()), *headers]})
+    await send({'type': 'http.response.body', 'body': body if scope['method'] != 'HEAD' else b''})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m track.api", description="Serve the TRACK queries as JSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        print("error: serving the API needs an ASGI server, e.g. pip install uvicorn", file=sys.stderr)
+        return 1
+    uvicorn.run("track.api:app", host=args.host, port=args.port, workers=args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
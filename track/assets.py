@@ -0,0 +1,67 @@
+import base64
+import mimetypes
+import os
+import threading
+from pathlib import Path
+
+# Files served by Streamlit under app/static/ when server.enableStaticServing is on (.streamlit/config.toml)
+STATIC_DIR = Path(__file__).resolve().parent.parent / "static"
+STATIC_URL = "app/static"
+
+# Static files already read and encoded by this process, by (path, mtime, size)
+_contents = {}
+_data_uris = {}
+
+
+def _key(path):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def _remember(memo, key, value):
+    # Forget the previous versions of the same file
+    for old in [k for k in memo if k[0] == key[0]]:
+        del memo[old]
+    memo[key] = value
+    return value
+
+
+# Bytes of a static file (download buttons...), read once per process and again only when the file changes
+def file_bytes(path):
+    key = _key(path)
+    if key not in _contents:
+        with open(path, 'rb') as f:
+            _remember(_contents, key, f.read())
+    return _contents[key]
+
+
+# base64 data URI of a static file, to inline it in HTML without encoding it again on every rerun
+def data_uri(path):
+    key = _key(path)
+    if key not in _data_uris:
+        mime = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        _remember(_data_uris, key, f"data:{mime};base64,{base64.b64encode(file_bytes(path)).decode()}")
+    return _data_uris[key]
+
+
+def static_serving_enabled():
+    from streamlit import config
+
+    return bool(config.get_option("server.enableStaticServing"))
+
+
+# Publish generated JSON as STATIC_DIR/folder/name, built by `build()` only when the file is missing; the
+# other files of the folder not starting with `prefix` (older versions of the data) are removed. Returns
+# the URL of the file relative to the page.
+def publish_static(folder, name, prefix, build):
+    directory = STATIC_DIR / folder
+    path = directory / name
+    if not path.exists():
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(build(), encoding='utf-8')
+        os.replace(tmp, path)
+        for old in directory.glob("*.json"):
+            if not old.name.startswith(prefix):
+                old.unlink(missing_ok=True)
+    return f"{STATIC_URL}/{folder}/{name}"
@@ -0,0 +1,363 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+import pyarrow.feather as feather
+
+from track.profiling import profiled
+from track.regions import DEPARTMENT_TO_REGION
+from track.segments import segment_flags
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds are not coordinated between processes
+    fcntl = None
+
+# Folder holding the SNCF source files and folder for the normalized columnar copies
+DATASETS_DIR = Path(os.environ.get("TRACK_DATASETS_DIR", "./datasets"))
+CACHE_DIR = Path(os.environ.get("TRACK_CACHE_DIR", "./.track_cache"))
+
+
+@dataclass(frozen=True)
+class Dataset:
+    name: str
+    filename: str
+    reader: Callable[[Path], pd.DataFrame]
+    prepare: Callable[[pd.DataFrame], pd.DataFrame]
+    version: int = 1
+    description: str = field(default="", compare=False)
+
+    @property
+    def path(self):
+        return DATASETS_DIR / self.filename
+
+
+# Registry of every dataset the pages can load, by name
+DATASETS = {}
+
+# Normalized frames already served by this process, by (name, source hash)
+_loaded = {}
+
+# Source hashes by (path, mtime, size) so unchanged files are not re-read to be hashed
+_hashes = {}
+
+# In-process build locks by lock file path, used where fcntl is not available
+_thread_locks = defaultdict(threading.Lock)
+_thread_locks_guard = threading.Lock()
+
+
+def read_semicolon_csv(dtype=None, **kwargs):
+    # Extra options (usecols, chunksize...) let streaming readers project and chunk the same source
+    def reader(path, **options):
+        return pd.read_csv(path, delimiter=';', dtype=dtype, **kwargs, **options)
+
+    return reader
+
+
+def register(name, filename, reader=None, dtype=None, version=1, description=""):
+    # Decorator registering a dataset; the decorated function turns the raw frame into the normalized one.
+    # Bump `version` whenever the preparation changes so stale cache files are not served.
+    def decorator(prepare):
+        DATASETS[name] = Dataset(
+            name=name,
+            filename=filename,
+            reader=reader or read_semicolon_csv(dtype),
+            prepare=prepare,
+            version=version,
+            description=description,
+        )
+        return prepare
+
+    return decorator
+
+
+def file_hash(path):
+    path = Path(path)
+    stat = path.stat()
+    key = (str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+    if key not in _hashes:
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        _hashes[key] = digest.hexdigest()
+    return _hashes[key]
+
+
+def dataset_hash(name):
+    return file_hash(DATASETS[name].path)
+
+
+def cache_path(name, digest):
+    dataset = DATASETS[name]
+    return CACHE_DIR / f"{name}-v{dataset.version}-{digest}.arrow"
+
+
+def _write_cache(target, frame):
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # Unique per thread too, since the sessions of a server process build tables from their own threads
+    tmp = target.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    # Uncompressed Arrow IPC so later loads can memory-map the file instead of decoding it
+    feather.write_feather(frame, tmp, compression='uncompressed')
+    os.replace(tmp, target)
+    return target
+
+
+@contextmanager
+def _build_lock(name):
+    # Serialize the builds of one table across the server processes sharing the cache directory, so workers
+    # starting together build it once and the others map the file it produced
+    path = CACHE_DIR / f"{name}.lock"
+    if fcntl is None:
+        # Without file locks, builds are still serialized between the threads of this process
+        with _thread_lock(path):
+            yield
+        return
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _thread_lock(path):
+    with _thread_locks_guard:
+        return _thread_locks[str(path)]
+
+
+def _stale_cache_files(name, current):
+    return [path for path in CACHE_DIR.glob(f"{name}-v*.arrow") if path != current]
+
+
+def _read_cache(path):
+    table = feather.read_table(path, memory_map=True)
+    # One block per column lets pandas keep numeric columns on the mapped buffers without a copy
+    return table.to_pandas(split_blocks=True)
+
+
+@profiled
+def load_dataset(name):
+    # Return the normalized frame for a registered dataset. Frames are shared between
+    # sessions, so callers must treat them as read-only and filter into new frames.
+    if name not in DATASETS:
+        raise KeyError(f"Unknown dataset: {name}")
+    dataset = DATASETS[name]
+    if not dataset.path.exists():
+        raise FileNotFoundError(dataset.path)
+
+    digest = dataset_hash(name)
+    key = (name, digest)
+    if key in _loaded:
+        return _loaded[key]
+
+    path = cache_path(name, digest)
+    if not path.exists():
+        with _build_lock(name):
+            if not path.exists():
+                frame = dataset.prepare(dataset.reader(dataset.path))
+                _write_cache(path, frame.reset_index(drop=True))
+
+                # Drop cache files left behind by older versions of the source file
+                for stale in _stale_cache_files(name, path):
+                    stale.unlink(missing_ok=True)
+
+    return _remember(key, _read_cache(path))
+
+
+def store_dataset(name, frame):
+    # Install an already normalized frame as the cache of the current source file, for ingestion jobs that
+    # build it from the previous frame plus the new rows instead of re-parsing the whole file. The frame is
+    # written as a new cache file in full: there is one file per source version, not one per partition.
+    digest = dataset_hash(name)
+    with _build_lock(name):
+        path = _write_cache(cache_path(name, digest), frame.reset_index(drop=True))
+        for stale in _stale_cache_files(name, path):
+            stale.unlink(missing_ok=True)
+    return _remember((name, digest), _read_cache(path))
+
+
+def _remember(key, frame):
+    # Forget frames from previous versions of the same sources
+    for old in [k for k in _loaded if k[0] == key[0]]:
+        del _loaded[old]
+    _loaded[key] = frame
+    return frame
+
+
+@profiled
+def load_derived(name, sources, build, version=1):
+    # Return a table derived from registered datasets, persisted in the cache directory and keyed
+    # on the hashes and versions of its sources. `build(previous)` receives the table built from the previous
+    # version of the sources (or None) so it can reuse the parts that did not change.
+    digest = hashlib.blake2b(
+        ';'.join(f"{dataset_hash(source)}:{DATASETS[source].version}" for source in sources).encode(),
+        digest_size=16,
+    ).hexdigest()
+    key = (name, digest)
+    if key in _loaded:
+        return _loaded[key]
+
+    path = CACHE_DIR / f"{name}-v{version}-{digest}.arrow"
+    if not path.exists():
+        with _build_lock(name):
+            if not path.exists():
+                _build_derived(name, version, path, build)
+
+    return _remember(key, _read_cache(path))
+
+
+def _build_derived(name, version, path, build):
+    stale = _stale_cache_files(name, path)
+    previous_path = max(stale, key=lambda p: p.stat().st_mtime, default=None)
+    if previous_path is not None and not previous_path.name.startswith(f"{name}-v{version}-"):
+        previous_path = None  # Built by an older version of the build function
+    previous = _read_cache(previous_path) if previous_path is not None else None
+
+    _write_cache(path, build(previous).reset_index(drop=True))
+    del previous
+    for old in stale:
+        old.unlink(missing_ok=True)
+
+
+# ---------------------------------------------------------------------------
+# Dataset registrations
+# ---------------------------------------------------------------------------
+
+@register(
+    "stations",
+    "gares-de-voyageurs.csv",
+    dtype={'nom': str, 'libellecourt': str, 'segment_drg': 'category',
+           'position_geographique': str, 'codeinsee': str, 'codes_uic': str},
+    version=2,
+    description="Passenger stations with coordinates, department, region and segment flags",
+)
+def _prepare_stations(df):
+    # Split 'position_geographique' column into 'latitude' and 'longitude'
+    position = df['position_geographique'].str.split(',', expand=True)
+    df['latitude'] = pd.to_numeric(position[0], errors='coerce').astype('float32')
+    df['longitude'] = pd.to_numeric(position[1], errors='coerce').astype('float32')
+
+    # Drop rows with NaN values in 'latitude' or 'longitude'
+    df = df.dropna(subset=['latitude', 'longitude'])
+
+    department = df['codeinsee'].str.zfill(5).str[:2]
+    df['department'] = department.astype('category')
+    df['region'] = department.map(DEPARTMENT_TO_REGION).astype('category')
+    df['segments'] = segment_flags(df['segment_drg'])
+    return df
+
+
+# Every column besides the station identity is a yearly passenger count
+_frequentation_dtypes = defaultdict(lambda: 'int32', {'nom_gare': str, 'code_uic_complet': 'int64',
+                                                      'code_postal': 'int32', 'segmentation_drg': 'category'})
+
+# Yearly passenger count columns of frequentation-gares.csv
+_passenger_column = re.compile(r'^total_voyageurs_(\d{4})$')
+
+
+# Years present in the frequentation schema, most recent first
+def passenger_years(columns):
+    return sorted((int(match.group(1)) for match in map(_passenger_column.match, columns) if match),
+                  reverse=True)
+
+
+@register(
+    "frequentation",
+    "frequentation-gares.csv",
+    dtype=_frequentation_dtypes,
+    version=2,
+    description="Yearly passenger counts per station (wide format) with segment flags",
+)
+def _prepare_frequentation(df):
+    df['segments'] = segment_flags(df['segmentation_drg'])
+    return df
+
+
+@register(
+    "traffic",
+    "frequentation-gares.csv",
+    dtype=_frequentation_dtypes,
+    description="Passenger counts per station and year (long format)",
+)
+def _prepare_traffic(df):
+    # One row per (station, year), years discovered from the column names
+    frames = [
+        pd.DataFrame({
+            'station_id': df['code_uic_complet'],
+            'year': year,
+            'passengers': df[f'total_voyageurs_{year}'],
+            'total_with_non_passengers': df[f'total_voyageurs_non_voyageurs_{year}'],
+        })
+        for year in passenger_years(df.columns)
+    ]
+    traffic = pd.concat(frames, ignore_index=True)
+    traffic['year'] = traffic['year'].astype('int16')
+    return traffic.sort_values(['station_id', 'year'])
+
+
+@register(
+    "regularity",
+    "regularite-mensuelle-tgv-aqst.csv",
+    dtype={'date': str, 'service': 'category', 'gare_depart': 'category', 'gare_arrivee': 'category',
+           'duree_moyenne': 'int32', 'nb_train_prevu': 'int32', 'nb_annulation': 'int32',
+           'commentaire_annulation': str, 'nb_train_depart_retard': 'int32',
+           'retard_moyen_depart': 'float32', 'retard_moyen_tous_trains_depart': 'float32',
+           'commentaire_retards_depart': str, 'nb_train_retard_arrivee': 'int32',
+           'retard_moyen_arrivee': 'float32', 'retard_moyen_tous_trains_arrivee': 'float32',
+           'commentaires_retard_arrivee': str, 'nb_train_retard_sup_15': 'int32',
+           'retard_moyen_trains_retard_sup15': 'float32', 'nb_train_retard_sup_30': 'int32',
+           'nb_train_retard_sup_60': 'int32', 'prct_cause_externe': 'float32',
+           'prct_cause_infra': 'float32', 'prct_cause_gestion_trafic': 'float32',
+           'prct_cause_materiel_roulant': 'float32', 'prct_cause_gestion_gare': 'float32',
+           'prct_cause_prise_en_charge_voyageurs': 'float32'},
+    description="Monthly TGV regularity per origin-destination",
+)
+def _prepare_regularity(df):
+    df['date'] = pd.to_datetime(df['date'], format='%Y-%m', errors='coerce')
+    return df
+
+
+@register(
+    "prices",
+    "tarifs-tgv-inoui-ouigo.csv",
+    dtype={'Transporteur': 'category', 'Gare origine': 'category', 'Gare origine - code UIC': 'int64',
+           'Destination': 'category', 'Gare destination - code UIC': 'int64', 'Classe': 'int8',
+           # Fares stay float64: they are displayed as is and float32 shows 101.9 as 101.900002
+           'Profil tarifaire': 'category', 'Prix minimum': 'float64', 'Prix maximum': 'float64'},
+    version=2,
+    description="TGV INOUI and OUIGO 2024 fares per route",
+)
+def _prepare_prices(df):
+    return df
+
+
+def read_geojson_features(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        geojson = json.load(f)
+    # One row per feature: its properties plus the geometry serialized as JSON text
+    return pd.DataFrame([
+        {**feature['properties'], 'geometry': json.dumps(feature['geometry'])}
+        for feature in geojson['features']
+    ])
+
+
+@register(
+    "railway_lines",
+    "lignes-lgv-et-par-ecartement.geojson",
+    reader=read_geojson_features,
+    description="Railway line sections with their GeoJSON geometry",
+)
+def _prepare_railway_lines(df):
+    if 'catlig' in df:
+        df['catlig'] = df['catlig'].astype('category')
+    return df
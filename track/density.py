@@ -0,0 +1,175 @@
+import json
+import math
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from track.assets import publish_static, static_serving_enabled
+from track.data import dataset_hash, load_dataset, load_derived
+from track.distances import station_coordinates_by_uic
+from track.profiling import timed
+from track.render_cache import RenderCache
+
+# Hexagon levels of the traffic density map: the map shows the first level whose max_zoom is at least its
+# zoom. Sizes are hexagon radii in km at the latitude of mainland France, fewer than 100 hexagons over the
+# country at the coarsest level.
+HEX_LEVELS = [
+    {'max_zoom': 5, 'size_km': 60.0},
+    {'max_zoom': 6, 'size_km': 30.0},
+    {'max_zoom': 7, 'size_km': 15.0},
+    {'max_zoom': 20, 'size_km': 7.5},
+]
+REFERENCE_LATITUDE = 46.5
+
+# Sphere of the Web Mercator projection used by the map tiles; hexagons are regular in that projection so
+# they tile the map without gaps
+_MERCATOR_RADIUS_M = 6378137.0
+_SQRT3 = math.sqrt(3)
+
+DensityMap = namedtuple('DensityMap', ['hex_count', 'map_html'])
+
+_maps = RenderCache("traffic", maxsize=16, shared=DensityMap)
+
+
+def _mercator(latitude, longitude):
+    x = _MERCATOR_RADIUS_M * np.radians(longitude)
+    y = _MERCATOR_RADIUS_M * np.log(np.tan(np.pi / 4 + np.radians(latitude) / 2))
+    return x, y
+
+
+def _geographic(x, y):
+    return np.degrees(2 * np.arctan(np.exp(y / _MERCATOR_RADIUS_M)) - np.pi / 2), np.degrees(x / _MERCATOR_RADIUS_M)
+
+
+def _hex_size_m(size_km):
+    return size_km * 1000 / math.cos(math.radians(REFERENCE_LATITUDE))
+
+
+# Axial coordinates (q, r) of the pointy-top hexagons of radius `size` (projected meters) containing the
+# points, by rounding the fractional cube coordinates
+def hex_cells(x, y, size):
+    q = (_SQRT3 / 3 * x - y / 3) / size
+    r = (2 / 3 * y) / size
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype('int32'), rr.astype('int32')
+
+
+def hex_centers(q, r, size):
+    return size * _SQRT3 * (q + r / 2), size * 1.5 * r
+
+
+# Latitude/longitude of the 6 corners of each hexagon, as (hexagons, 6) arrays
+def hex_corners(q, r, size):
+    x, y = hex_centers(np.asarray(q), np.asarray(r), size)
+    angles = np.radians(30 + 60 * np.arange(6))
+    return _geographic(x[:, None] + size * np.cos(angles), y[:, None] + size * np.sin(angles))
+
+
+# One row per (year, level, hexagon) with traffic: passengers of its stations, number of stations, area and
+# passengers per km² (the areas shrink with the latitude, as on the ground)
+def _build_traffic_hexbins(traffic, stations):
+    # Traffic station ids are UIC codes, matched on any code of the stations file
+    located = traffic.join(station_coordinates_by_uic(stations), on='station_id', how='inner')
+    located = located.dropna(subset=['latitude', 'longitude'])
+    x, y = _mercator(located['latitude'].to_numpy(), located['longitude'].to_numpy())
+
+    levels = []
+    for level, settings in enumerate(HEX_LEVELS):
+        size = _hex_size_m(settings['size_km'])
+        q, r = hex_cells(x, y, size)
+        bins = located[['year', 'passengers']].assign(q=q, r=r).groupby(['year', 'q', 'r']).agg(
+            passengers=('passengers', 'sum'), stations=('passengers', 'size')).reset_index()
+        latitude, longitude = _geographic(*hex_centers(bins['q'].to_numpy(), bins['r'].to_numpy(), size))
+        scale = np.cos(np.radians(latitude))
+        bins['area_km2'] = 1.5 * _SQRT3 * (size / 1000 * scale) ** 2
+        bins['density'] = bins['passengers'] / bins['area_km2']
+        levels.append(bins.assign(level=np.int8(level), latitude=latitude, longitude=longitude))
+
+    hexbins = pd.concat(levels, ignore_index=True)
+    hexbins = hexbins[hexbins['passengers'] > 0]
+    columns = ['year', 'level', 'q', 'r', 'latitude', 'longitude', 'passengers', 'stations', 'area_km2', 'density']
+    return hexbins[columns].astype({'passengers': 'int64', 'stations': 'int32', 'area_km2': 'float32',
+                                    'density': 'float32'})
+
+
+def load_traffic_hexbins():
+    return load_derived("traffic_hexbins", ["traffic", "stations"],
+                        lambda previous: _build_traffic_hexbins(load_dataset("traffic"), load_dataset("stations")))
+
+
+# Hexagons of one year and level as a GeoJSON FeatureCollection, filled by `colormap` from log10 density
+def hexbin_geojson(bins, size_km, colormap):
+    latitude, longitude = hex_corners(bins['q'].to_numpy(), bins['r'].to_numpy(), _hex_size_m(size_km))
+    latitude, longitude = latitude.round(5), longitude.round(5)
+    colors = [colormap(value) for value in np.log10(bins['density'].to_numpy())]
+    features = [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon',
+                         'coordinates': [[[lon, lat] for lat, lon in zip(lats + lats[:1], lons + lons[:1])]]},
+            'properties': {'passengers': passengers, 'stations': count, 'density': round(density, 1),
+                           'color': color},
+        }
+        for lats, lons, passengers, count, density, color in zip(
+            latitude.tolist(), longitude.tolist(), bins['passengers'].tolist(), bins['stations'].tolist(),
+            bins['density'].astype(float).tolist(), colors)
+    ]
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+# Map of the passengers per km² of one year: one hexagon layer per level, swapped as the zoom changes.
+# The color scale is shared by the levels, since densities do not depend on the hexagon size.
+# With `publish`, only the coarsest level is embedded in the page; the finer ones are written to the static
+# directory (static/hexbins) and downloaded when the user zooms in.
+def build_density_map(hexbins, year, publish=False):
+    import folium
+    from branca.colormap import linear
+
+    from track.maps import ZoomTieredHexbins
+
+    rows = hexbins[hexbins['year'] == year]
+    log_density = np.log10(rows['density'].to_numpy())
+    colormap = linear.YlOrRd_09.scale(*np.percentile(log_density, [5, 99.5]))
+    colormap.caption = "Passengers per km² per year (log10)"
+
+    digest = f"{dataset_hash('traffic')[:16]}{dataset_hash('stations')[:16]}"
+    with timed("hexbin layers"):
+        levels = []
+        for level, settings in enumerate(HEX_LEVELS):
+            bins = rows[rows['level'] == level]
+            if publish and level > 0:
+                url = publish_static("hexbins", f"{digest}-{year}-{level}.json", digest,
+                                     lambda: json.dumps(hexbin_geojson(bins, settings['size_km'], colormap),
+                                                        separators=(',', ':')))
+                levels.append({'max_zoom': settings['max_zoom'], 'url': url})
+            else:
+                levels.append({'max_zoom': settings['max_zoom'],
+                               'geojson': hexbin_geojson(bins, settings['size_km'], colormap)})
+
+    density_map = folium.Map(location=[46.603354, 1.888334], zoom_start=5, tiles='cartodbpositron')
+    layer = folium.FeatureGroup(name=f"Passengers {year}").add_to(density_map)
+    ZoomTieredHexbins(levels, layer).add_to(density_map)
+    colormap.add_to(density_map)
+    with timed("density map render"):
+        map_html = folium.Figure().add_child(density_map).render()
+    return DensityMap(int((rows['level'] == 0).sum()), map_html)
+
+
+# Rendered density map of a year (the latest by default), built once per version of the frequentation and
+# stations files. The finer levels are fetched from the static directory when Streamlit serves it.
+def get_density_map(year=None):
+    if year is None:
+        year = load_traffic_hexbins()['year'].max()
+    publish = static_serving_enabled()
+    with timed("density map"):
+        return _maps.get_or_build(
+            (int(year), dataset_hash("stations"), publish),
+            lambda: build_density_map(load_traffic_hexbins(), int(year), publish),
+        )
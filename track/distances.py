@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from track.data import load_dataset, load_derived
+
+# Mean Earth radius (IUGG)
+EARTH_RADIUS_KM = 6371.0088
+
+ORIGIN_UIC = 'Gare origine - code UIC'
+DESTINATION_UIC = 'Gare destination - code UIC'
+
+
+# Great-circle distance between arrays of coordinates in degrees (haversine formula)
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(values, dtype='float64')) for values in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+# Coordinates of every station indexed by UIC code ('codes_uic' may list several codes per station)
+def station_coordinates_by_uic(stations):
+    codes = stations[['codes_uic', 'latitude', 'longitude']].assign(uic=stations['codes_uic'].str.split(';'))
+    codes = codes.explode('uic').dropna(subset=['uic'])
+    codes['uic'] = pd.to_numeric(codes['uic'], errors='coerce')
+    codes = codes.dropna(subset=['uic']).astype({'uic': 'int64'})
+    return codes.drop_duplicates('uic').set_index('uic')[['latitude', 'longitude']]
+
+
+# Distance of every distinct (origin UIC, destination UIC) pair of the tariff table, in one vectorized pass.
+# Pairs with a code missing from gares-de-voyageurs.csv get NaN.
+def _build_route_distances(prices, stations):
+    pairs = prices[[ORIGIN_UIC, DESTINATION_UIC]].drop_duplicates().reset_index(drop=True)
+    coordinates = station_coordinates_by_uic(stations)
+    origin = coordinates.reindex(pairs[ORIGIN_UIC].to_numpy())
+    destination = coordinates.reindex(pairs[DESTINATION_UIC].to_numpy())
+    distance = haversine_km(origin['latitude'], origin['longitude'],
+                            destination['latitude'], destination['longitude'])
+    pairs['Distance (km)'] = np.round(distance, 1)
+    return pairs
+
+
+def load_route_distances():
+    return load_derived("route_distances", ["prices", "stations"],
+                        lambda previous: _build_route_distances(load_dataset("prices"), load_dataset("stations")))
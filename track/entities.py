@@ -0,0 +1,219 @@
+import unicodedata
+from collections import Counter, defaultdict
+
+import numpy as np
+import pandas as pd
+
+from track.data import dataset_hash, load_dataset, load_derived, passenger_years
+from track.distances import DESTINATION_UIC, ORIGIN_UIC
+from track.network import rail_network_available
+from track.prices import load_priced_routes
+from track.regularity import COUNT_COLUMNS, load_regularity_cube
+
+# Datasets whose station records are resolved to station ids
+RESOLVED_DATASETS = ['stations', 'frequentation', 'prices', 'regularity']
+
+# Regularity names whose closest spelling is another station, by normalized name -> normalized name of the
+# station they designate in the tariff table
+NAME_ALIASES = {
+    'PARIS LYON': 'PARIS GARE DE LYON',
+    'PARIS VAUGIRARD': 'PARIS MONTPARNASSE 3 VAUGIRARD',
+    'LILLE': 'LILLE EUROPE',
+    'MARNE LA VALLEE': 'MARNE LA VALLEE CHESSY',
+    'VALENCE ALIXAN TGV': 'VALENCE TGV RHONE ALPES SUD',
+}
+
+# Names are matched when the Dice coefficient of their character trigrams reaches this score
+MIN_NAME_SCORE = 0.6
+
+# Abbreviations spelled out before names are compared
+_ABBREVIATIONS = {'ST': 'SAINT', 'STE': 'SAINTE'}
+
+# Resolvers already built by this process, by source file hashes
+_resolvers = {}
+
+
+# Upper case without accents, punctuation or abbreviations: "Saint-Pierre-des-Corps" and
+# "ST PIERRE DES CORPS" both give "SAINT PIERRE DES CORPS"
+def normalize_name(name):
+    name = unicodedata.normalize('NFKD', str(name)).encode('ascii', 'ignore').decode().upper()
+    words = ''.join(char if char.isalnum() else ' ' for char in name).split()
+    return ' '.join(_ABBREVIATIONS.get(word, word) for word in words)
+
+
+def _trigrams(name):
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+# Inverted index from character trigrams to candidate names. A query is only compared with the names
+# sharing at least one of its trigrams (blocking), never with every candidate.
+class TrigramBlocker:
+    def __init__(self, names):
+        self.names = list(names)
+        self.sizes = []
+        self.postings = defaultdict(list)
+        for position, name in enumerate(self.names):
+            grams = _trigrams(name)
+            self.sizes.append(len(grams))
+            for gram in grams:
+                self.postings[gram].append(position)
+
+    # Position of the best candidate and its Dice score, (None, 0.0) when no trigram is shared
+    def best_match(self, name):
+        grams = _trigrams(name)
+        shared = Counter(position for gram in grams for position in self.postings.get(gram, ()))
+        if not shared:
+            return None, 0.0
+        position, score = max(((position, 2 * count / (len(grams) + self.sizes[position]))
+                               for position, count in shared.items()), key=lambda item: item[1])
+        return position, score
+
+
+def _uic_codes(values):
+    codes = pd.to_numeric(values, errors='coerce')
+    return codes.astype('Int64')
+
+
+# One row per station record of every dataset (dataset, key, name) with the station id it resolves to.
+# Station ids are the first UIC code of the station in gares-de-voyageurs.csv. Records carrying a UIC code
+# are joined on it; codes missing from the stations file (foreign stations) become their own id. Records
+# with a name only (regularity) are matched on their normalized name against every named record, and
+# names left unmatched get negative ids.
+def _build_station_entities(stations, frequentation, prices, regularity):
+    codes = stations[['nom', 'codes_uic']].assign(uic=stations['codes_uic'].str.split(';')).explode('uic')
+    codes['uic'] = _uic_codes(codes['uic'])
+    codes['station_id'] = _uic_codes(stations['codes_uic'].str.split(';').str[0]).reindex(codes.index)
+    by_uic = codes.dropna(subset=['uic', 'station_id']).drop_duplicates('uic').set_index('uic')['station_id']
+
+    records = [
+        pd.DataFrame({'dataset': 'stations', 'key': stations['codes_uic'].astype(str),
+                      'name': stations['nom'].astype(str), 'uic': codes.groupby(level=0)['station_id'].first()}),
+        pd.DataFrame({'dataset': 'frequentation', 'key': frequentation['code_uic_complet'].astype(str),
+                      'name': frequentation['nom_gare'].astype(str),
+                      'uic': _uic_codes(frequentation['code_uic_complet'])}),
+    ]
+    for name_column, uic_column in (('Gare origine', ORIGIN_UIC), ('Destination', DESTINATION_UIC)):
+        pairs = prices[[name_column, uic_column]].drop_duplicates(uic_column)
+        records.append(pd.DataFrame({'dataset': 'prices', 'key': pairs[uic_column].astype(str),
+                                     'name': pairs[name_column].astype(str), 'uic': _uic_codes(pairs[uic_column])}))
+    coded = pd.concat(records, ignore_index=True).drop_duplicates(['dataset', 'key'])
+    coded['station_id'] = coded['uic'].map(by_uic).fillna(coded['uic']).astype('int64')
+    coded['method'] = 'uic'
+    coded['score'] = 1.0
+
+    # Candidate names: every record resolved on its code, once per (normalized name, station)
+    candidates = coded.assign(normalized=coded['name'].map(normalize_name))
+    candidates = candidates.drop_duplicates(['normalized', 'station_id'])
+    # Tariff names first, so that between equal scores the TGV station wins
+    candidates = candidates.sort_values('dataset', key=lambda dataset: dataset != 'prices', kind='stable')
+    by_normalized = candidates.drop_duplicates('normalized').set_index('normalized')['station_id']
+    blocker = TrigramBlocker(candidates['normalized'])
+    candidate_ids = candidates['station_id'].to_numpy()
+
+    names = sorted(set(regularity['gare_depart'].astype(str)) | set(regularity['gare_arrivee'].astype(str)))
+    rows = []
+    unmatched = 0
+    for name in names:
+        normalized = normalize_name(name)
+        alias = NAME_ALIASES.get(normalized)
+        if alias in by_normalized:
+            station_id, method, score = by_normalized[alias], 'alias', 1.0
+        else:
+            position, score = blocker.best_match(normalized)
+            if position is not None and score >= MIN_NAME_SCORE:
+                station_id, method = candidate_ids[position], 'name'
+            else:
+                unmatched += 1
+                station_id, method = -unmatched, 'unmatched'
+        rows.append({'dataset': 'regularity', 'key': name, 'name': name, 'station_id': station_id,
+                     'method': method, 'score': round(score, 3)})
+
+    entities = pd.concat([coded.drop(columns='uic'), pd.DataFrame(rows)], ignore_index=True)
+    return entities.astype({'station_id': 'int64', 'score': 'float32', 'dataset': 'category',
+                            'method': 'category'})
+
+
+def load_station_entities():
+    return load_derived("station_entities", RESOLVED_DATASETS,
+                        lambda previous: _build_station_entities(
+                            load_dataset("stations"), load_dataset("frequentation"),
+                            load_dataset("prices"), load_dataset("regularity")))
+
+
+# Station ids of the records of each dataset, as lookups built once from the entity table
+class StationResolver:
+    def __init__(self, entities):
+        self.entities = entities
+        self._ids = {
+            dataset: rows.set_index('key')['station_id']
+            for dataset, rows in entities.groupby('dataset', observed=True)
+        }
+        # Display name of every station id: the stations file name, else the first name seen
+        named = entities.sort_values('dataset', key=lambda dataset: dataset != 'stations', kind='stable')
+        self.names = named.drop_duplicates('station_id').set_index('station_id')['name']
+
+    # Station ids of the keys of a dataset (codes as text, or names for regularity); <NA> when unknown
+    def station_ids(self, dataset, keys):
+        keys = pd.Series(keys, copy=False).astype(str)
+        return keys.map(self._ids[dataset]).astype('Int64')
+
+    def station_name(self, station_id):
+        return self.names.get(station_id, str(station_id))
+
+
+def load_station_resolver():
+    digest = tuple(dataset_hash(name) for name in RESOLVED_DATASETS)
+    if digest not in _resolvers:
+        _resolvers.clear()
+        _resolvers[digest] = StationResolver(load_station_entities())
+    return _resolvers[digest]
+
+
+# One row per directed (origin, destination) station pair found in the regularity or tariff data:
+# regularity totals over the whole period, fare range and distance, and the latest yearly passenger count
+# of both stations. Pairs present in only one dataset keep NaN for the other's columns.
+def _build_od_facts(resolver, cube, priced, frequentation):
+    cube = cube.assign(origin_id=resolver.station_ids('regularity', cube['gare_depart']).to_numpy(),
+                       destination_id=resolver.station_ids('regularity', cube['gare_arrivee']).to_numpy())
+    regularity = cube.groupby(['origin_id', 'destination_id']).agg(
+        months=('month', 'nunique'),
+        **{column: (column, 'sum') for column in COUNT_COLUMNS + ['delay_sum', 'delay_count']},
+    )
+    regularity['mean_arrival_delay'] = regularity.pop('delay_sum') / regularity.pop('delay_count')
+    regularity['late_share'] = regularity['nb_train_retard_arrivee'] / regularity['nb_train_prevu']
+    regularity['cancelled_share'] = regularity['nb_annulation'] / regularity['nb_train_prevu']
+
+    priced = priced.assign(origin_id=resolver.station_ids('prices', priced[ORIGIN_UIC]).to_numpy(),
+                           destination_id=resolver.station_ids('prices', priced[DESTINATION_UIC]).to_numpy())
+    fares = priced.groupby(['origin_id', 'destination_id']).agg(
+        min_price=('Prix minimum', 'min'),
+        max_price=('Prix maximum', 'max'),
+        carriers=('Transporteur', 'nunique'),
+        distance_km=('Distance (km)', 'first'),
+    )
+
+    facts = regularity.join(fares, how='outer').reset_index()
+    facts['min_price_per_km'] = facts['min_price'] / facts['distance_km']
+
+    latest = passenger_years(frequentation.columns)[0]
+    passengers = pd.Series(frequentation[f'total_voyageurs_{latest}'].to_numpy(),
+                           index=resolver.station_ids('frequentation', frequentation['code_uic_complet']))
+    passengers = passengers[passengers.index.notna()].groupby(level=0).sum()
+    facts['origin_passengers'] = facts['origin_id'].map(passengers)
+    facts['destination_passengers'] = facts['destination_id'].map(passengers)
+    facts['passengers_year'] = np.int16(latest)
+
+    facts.insert(2, 'origin', facts['origin_id'].map(resolver.station_name))
+    facts.insert(3, 'destination', facts['destination_id'].map(resolver.station_name))
+    return facts.astype({'origin_id': 'int64', 'destination_id': 'int64'})
+
+
+def _od_fact_sources():
+    return RESOLVED_DATASETS + (["railway_lines"] if rail_network_available() else [])
+
+
+def load_od_facts():
+    return load_derived("od_facts", _od_fact_sources(),
+                        lambda previous: _build_od_facts(load_station_resolver(), load_regularity_cube(),
+                                                         load_priced_routes(), load_dataset("frequentation")))
@@ -0,0 +1,254 @@
+# Offline ingestion of new SNCF dataset drops:
+#
+#   python -m track.ingest regularity path/to/new-months.csv      # append months not yet in the file
+#   python -m track.ingest frequentation path/to/2024-counts.csv  # add new total_voyageurs_YYYY columns
+#   python -m track.ingest prices path/to/tarifs.csv              # replace a full snapshot
+#   python -m track.ingest regularity drop.csv --dry-run          # only validate the drop
+#
+# The drop is validated against the current file's schema. The source file in the datasets folder is then
+# updated and the columnar cache for its new version is written from the previous cache plus the new rows,
+# so the history is not parsed again. Each version of a dataset is a single Arrow file, so that cache is
+# still written whole (a few MB for regularity), and the updated source is read once more to be hashed.
+# Finally only the derived tables of the updated datasets are rebuilt; the incremental regularity cube only
+# aggregates the years that changed.
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from track.data import DATASETS, load_dataset, passenger_years, store_dataset
+
+# Columns identifying a row of each dataset
+KEYS = {
+    'regularity': ['date', 'service', 'gare_depart', 'gare_arrivee'],
+    'frequentation': ['code_uic_complet'],
+    'prices': ['Transporteur', 'Gare origine - code UIC', 'Gare destination - code UIC', 'Classe',
+               'Profil tarifaire'],
+    'stations': ['codes_uic'],
+}
+
+
+class IngestError(ValueError):
+    pass
+
+
+def _derived_loaders(name):
+    # Imported here since these modules import the data layer themselves
+    from track.anomalies import load_anomaly_scores
+    from track.density import load_traffic_hexbins
+    from track.distances import load_route_distances
+    from track.entities import load_od_facts, load_station_entities
+    from track.network import load_graph_tables, load_rail_distances, rail_network_available
+    from track.prices import load_priced_routes
+    from track.regularity import load_regularity_cube
+
+    rail = [load_graph_tables, load_rail_distances] if rail_network_available() else []
+    # Every dataset names stations, so the station ids and the origin-destination table follow all of them
+    entities = [load_station_entities, load_od_facts]
+    return {
+        'regularity': [load_regularity_cube, load_anomaly_scores] + entities,
+        'prices': [load_route_distances, load_priced_routes] + rail[1:] + entities,
+        'stations': [load_route_distances, load_priced_routes, load_traffic_hexbins] + rail + entities,
+        'frequentation': [load_traffic_hexbins] + entities,
+    }.get(name, [])
+
+
+def _header(path):
+    return pd.read_csv(path, sep=';', nrows=0, encoding='utf-8-sig').columns.tolist()
+
+
+def _read_raw(path):
+    # Text as found in the file, used to write the new rows without reformatting numbers
+    return pd.read_csv(path, sep=';', dtype=str, keep_default_na=False, encoding='utf-8-sig')
+
+
+# Parse the drop with the dataset's own reader and preparation, reporting values of the wrong type
+def _read_normalized(name, path):
+    dataset = DATASETS[name]
+    try:
+        return dataset.prepare(dataset.reader(path))
+    except (ValueError, TypeError) as error:
+        raise IngestError(f"{path}: values do not match the {name} schema ({error})") from error
+
+
+def _check_keys(name, frame, label):
+    duplicated = frame.duplicated(KEYS[name]).sum()
+    if duplicated:
+        raise IngestError(f"{label}: {duplicated} rows share the same {', '.join(KEYS[name])}")
+
+
+def _write_atomically(target, write):
+    tmp = target.with_suffix(f".{os.getpid()}.tmp")
+    write(tmp)
+    os.replace(tmp, target)
+
+
+def _union_categories(frame, reference):
+    # Concatenating categoricals with different categories gives objects; restore the normalized dtypes
+    categories = [column for column, dtype in reference.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)]
+    return frame.astype({column: 'category' for column in categories})
+
+
+# New months of monthly regularity: months already in the file are skipped, the others are appended
+def _append_partitions(name, drop_path, dry_run):
+    source = DATASETS[name].path
+    columns = _header(source)
+    drop_columns = _header(drop_path)
+    if set(drop_columns) != set(columns):
+        missing, extra = set(columns) - set(drop_columns), set(drop_columns) - set(columns)
+        raise IngestError(f"{drop_path}: columns differ from {source.name} "
+                          f"(missing: {sorted(missing)}, unexpected: {sorted(extra)})")
+
+    current = load_dataset(name)
+    drop = _read_normalized(name, drop_path)
+    if drop['date'].isna().any():
+        raise IngestError(f"{drop_path}: {drop['date'].isna().sum()} rows have a date that is not YYYY-MM")
+    _check_keys(name, drop, str(drop_path))
+
+    new_months = ~drop['date'].isin(current['date'].unique())
+    skipped = sorted(drop.loc[~new_months, 'date'].dt.strftime('%Y-%m').unique())
+    if skipped:
+        print(f"{name}: skipping months already ingested: {', '.join(skipped)}")
+    if not new_months.any():
+        print(f"{name}: nothing new to append")
+        return False
+    months = sorted(drop.loc[new_months, 'date'].dt.strftime('%Y-%m').unique())
+    print(f"{name}: appending {int(new_months.sum())} rows for {', '.join(months)}")
+    if dry_run:
+        return False
+
+    # Append the new rows as text, then install the cache built from the previous frame plus the new rows
+    raw = _read_raw(drop_path).loc[new_months.to_numpy(), columns]
+    with open(source, 'rb+') as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b'\n':
+            f.write(b'\n')
+    raw.to_csv(source, sep=';', header=False, index=False, mode='a', encoding='utf-8')
+
+    appended = drop.loc[new_months, current.columns]
+    store_dataset(name, _union_categories(pd.concat([current, appended], ignore_index=True), current))
+    return True
+
+
+# New yearly passenger columns: stations are matched on their UIC code and years already present are refused
+def _add_year_columns(name, drop_path, dry_run):
+    source = DATASETS[name].path
+    columns = _header(source)
+    drop_columns = _header(drop_path)
+    years = [year for year in passenger_years(drop_columns) if year not in passenger_years(columns)]
+    if not years:
+        raise IngestError(f"{drop_path}: no total_voyageurs_YYYY column for a year not already ingested")
+    new_columns = [column for year in sorted(years, reverse=True)
+                   for column in (f'total_voyageurs_{year}', f'total_voyageurs_non_voyageurs_{year}')]
+    missing = [column for column in new_columns + KEYS[name] if column not in drop_columns]
+    if missing:
+        raise IngestError(f"{drop_path}: missing columns {missing}")
+
+    raw = _read_raw(drop_path)
+    try:
+        counts = raw[new_columns].replace('', '0').astype('int32')
+    except ValueError as error:
+        raise IngestError(f"{drop_path}: passenger counts must be integers ({error})") from error
+    counts.insert(0, 'code_uic_complet', pd.to_numeric(raw['code_uic_complet'], errors='coerce'))
+    _check_keys(name, counts, str(drop_path))
+
+    current = load_dataset(name)
+    traffic = load_dataset('traffic')
+    unknown = ~counts['code_uic_complet'].isin(current['code_uic_complet'])
+    if unknown.any():
+        raise IngestError(f"{drop_path}: {int(unknown.sum())} stations are not in {source.name}")
+    print(f"{name}: adding {', '.join(map(str, sorted(years)))} for {len(counts)} stations"
+          f" ({len(current) - len(counts)} stations without counts get 0)")
+    if dry_run:
+        return False
+
+    # Columns cannot be appended to a CSV in place, so the (small) file is rewritten with the new years first
+    counts = current[['code_uic_complet']].merge(counts, on='code_uic_complet', how='left')
+    counts = counts[new_columns].fillna(0).astype('int32')
+    text = _read_raw(source)
+    head = [column for column in columns if not column.startswith('total_voyageurs')]
+    text = pd.concat([text[head], counts.astype(str), text[[c for c in columns if c not in head]]], axis=1)
+    _write_atomically(source, lambda tmp: text.to_csv(tmp, sep=';', index=False, encoding='utf-8'))
+
+    # Wide table: previous frame plus the new columns, in the same order as the file
+    frequentation = pd.concat([current, counts], axis=1)[list(text.columns) + ['segments']]
+    store_dataset(name, frequentation)
+
+    # Long table: previous rows plus one row per station for every new year
+    added = pd.concat([
+        pd.DataFrame({
+            'station_id': current['code_uic_complet'],
+            'year': year,
+            'passengers': counts[f'total_voyageurs_{year}'],
+            'total_with_non_passengers': counts[f'total_voyageurs_non_voyageurs_{year}'],
+        })
+        for year in years
+    ], ignore_index=True).astype({'year': 'int16'})
+    store_dataset('traffic', pd.concat([traffic, added], ignore_index=True).sort_values(['station_id', 'year']))
+    return True
+
+
+# Full snapshots (fares, stations): the drop replaces the file once its schema and keys check out
+def _replace_snapshot(name, drop_path, dry_run):
+    source = DATASETS[name].path
+    missing = [column for column in _header(source) if column not in _header(drop_path)]
+    if missing:
+        raise IngestError(f"{drop_path}: missing columns {missing}")
+    drop = _read_normalized(name, drop_path)
+    _check_keys(name, drop, str(drop_path))
+    print(f"{name}: replacing {source.name} with {len(drop)} rows")
+    if dry_run:
+        return False
+
+    _write_atomically(source, lambda tmp: tmp.write_bytes(drop_path.read_bytes()))
+    store_dataset(name, drop)
+    return True
+
+
+MODES = {
+    'regularity': _append_partitions,
+    'frequentation': _add_year_columns,
+    'prices': _replace_snapshot,
+    'stations': _replace_snapshot,
+}
+
+
+def ingest(name, drop_path, dry_run=False):
+    if name not in MODES:
+        raise IngestError(f"Cannot ingest {name}; expected one of {', '.join(MODES)}")
+    if not DATASETS[name].path.exists():
+        raise FileNotFoundError(DATASETS[name].path)
+
+    start = time.perf_counter()
+    changed = MODES[name](name, drop_path, dry_run)
+    print(f"{name}: source and cache updated in {time.perf_counter() - start:.2f}s" if changed
+          else f"{name}: source left unchanged")
+    if not changed:
+        return False
+
+    for loader in _derived_loaders(name):
+        start = time.perf_counter()
+        loader()
+        print(f"  rebuilt {loader.__name__.removeprefix('load_')} in {time.perf_counter() - start:.2f}s")
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m track.ingest", description="Ingest a new SNCF dataset drop")
+    parser.add_argument("dataset", choices=sorted(MODES))
+    parser.add_argument("drop", type=Path)
+    parser.add_argument("--dry-run", action="store_true", help="validate the drop without changing anything")
+    args = parser.parse_args(argv)
+    try:
+        ingest(args.dataset, args.drop, args.dry_run)
+    except (IngestError, FileNotFoundError) as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import json
+
+from branca.element import MacroElement
+from folium.plugins import FastMarkerCluster
+from jinja2 import Template
+
+from track.railway import COLOR_MAPPING, TOOLTIP_ALIASES
+from track.regions import REGION_COLORS
+
+# Builds one marker per data row in the browser, with the same icon and popup as folium.Marker/folium.Icon
+STATION_MARKER_CALLBACK = """
+function (row) {
+    var marker = L.marker(new L.LatLng(row[0], row[1]));
+    marker.setIcon(L.AwesomeMarkers.icon({markerColor: row[3], icon: 'info-sign', prefix: 'glyphicon'}));
+    marker.bindPopup(row[2]);
+    return marker;
+}"""
+
+
+# Station markers as a single clustered layer: popups and colors are computed column-wise
+# and shipped as one compact data array instead of one folium.Marker per station
+def station_markers_layer(stations, name="Stations"):
+    region_name = stations['region'].astype(object).fillna('Unknown Region')
+    color = region_name.map(REGION_COLORS).fillna('black')
+    popup = stations['nom'].astype(str) + '<br><b>Region:</b> ' + region_name
+
+    data = [list(row) for row in zip(stations['latitude'].astype(float).round(6).tolist(),
+                                     stations['longitude'].astype(float).round(6).tolist(),
+                                     popup.tolist(),
+                                     color.tolist())]
+    return FastMarkerCluster(data, callback=STATION_MARKER_CALLBACK, name=name, chunkedLoading=True)
+
+
+# Railway lines drawn from precomputed simplification tiers: one GeoJSON layer per category is
+# added to its FeatureGroup, and swapped for the matching tier whenever the zoom crosses a tier limit.
+# Tiers given a URL in `urls` (see track.railway.publish_line_tiers) are not embedded in the page but fetched
+# the first time the zoom needs them; the finest tier already loaded is shown meanwhile.
+class ZoomTieredLines(MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            (function () {
+                var map = {{ this._parent.get_name() }};
+                var tiers = {{ this.tiers|tojson }};
+                var groups = {
+                    {%- for category, group in this.groups.items() %}
+                    {{ category|tojson }}: {{ group.get_name() }},
+                    {%- endfor %}
+                };
+                var colors = {{ this.colors|tojson }};
+                var aliases = {{ this.aliases|tojson }};
+                var current = null;
+                var wanted = null;
+
+                function tooltip(properties) {
+                    return Object.keys(aliases).map(function (field) {
+                        var value = properties[field];
+                        return '<b>' + aliases[field] + '</b> ' + (value === null ? '' : value);
+                    }).join('<br>');
+                }
+
+                // A tier that cannot be fetched is left out: the coarser tiers stay on the map
+                function load(tier) {
+                    if (tier.layers || tier.loading) { return; }
+                    tier.loading = fetch(tier.url)
+                        .then(function (response) { return response.json(); })
+                        .then(function (layers) { tier.layers = layers; render(); })
+                        .catch(function () {});
+                }
+
+                function render() {
+                    wanted = tiers.length - 1;
+                    for (var i = 0; i < tiers.length; i++) {
+                        if (map.getZoom() <= tiers[i].max_zoom) { wanted = i; break; }
+                    }
+                    load(tiers[wanted]);
+                    var index = wanted;
+                    while (!tiers[index].layers) { index--; }
+                    if (index === current) { return; }
+                    current = index;
+                    Object.keys(groups).forEach(function (category) {
+                        groups[category].clearLayers();
+                        var data = tiers[index].layers[category];
+                        if (!data) { return; }
+                        L.geoJSON(data, {
+                            style: {color: colors[category], weight: 2, opacity: 0.8},
+                            onEachFeature: function (feature, layer) {
+                                layer.bindTooltip(tooltip(feature.properties), {sticky: true});
+                            }
+                        }).addTo(groups[category]);
+                    });
+                }
+
+                map.on('zoomend', render);
+                render();
+            })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, tiers, groups, colors=COLOR_MAPPING, aliases=TOOLTIP_ALIASES, urls=None):
+        super().__init__()
+        self._name = 'ZoomTieredLines'
+        self.groups = groups
+        self.colors = colors
+        self.aliases = aliases
+        urls = urls or {}
+        self.tiers = [
+            {'max_zoom': int(tier_rows['max_zoom'].iat[0]), 'url': urls[tier]} if tier in urls else
+            {
+                'max_zoom': int(tier_rows['max_zoom'].iat[0]),
+                'layers': {row.catlig: json.loads(row.geojson) for row in tier_rows.itertuples()},
+            }
+            for tier, tier_rows in tiers.sort_values('tier').groupby('tier')
+        ]
+
+
+# Hexagon layers of several sizes (see track.density): the layer of the current zoom level is drawn in
+# `group`, filled with the color computed for each hexagon, and swapped whenever the zoom crosses a level.
+# As with ZoomTieredLines, levels given by a `url` instead of their `geojson` are fetched the first time the
+# zoom needs them, the finest level already loaded being shown meanwhile.
+class ZoomTieredHexbins(MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            (function () {
+                var map = {{ this._parent.get_name() }};
+                var group = {{ this.group.get_name() }};
+                var levels = {{ this.levels|tojson }};
+                var current = null;
+
+                function tooltip(properties) {
+                    return '<b>Passengers</b> ' + properties.passengers.toLocaleString('en-US')
+                        + '<br><b>Stations</b> ' + properties.stations
+                        + '<br><b>Per km²</b> ' + properties.density.toLocaleString('en-US');
+                }
+
+                // A level that cannot be fetched is left out: the coarser levels stay on the map
+                function load(level) {
+                    if (level.geojson || level.loading) { return; }
+                    level.loading = fetch(level.url)
+                        .then(function (response) { return response.json(); })
+                        .then(function (geojson) { level.geojson = geojson; render(); })
+                        .catch(function () {});
+                }
+
+                function render() {
+                    var wanted = levels.length - 1;
+                    for (var i = 0; i < levels.length; i++) {
+                        if (map.getZoom() <= levels[i].max_zoom) { wanted = i; break; }
+                    }
+                    load(levels[wanted]);
+                    var index = wanted;
+                    while (!levels[index].geojson) { index--; }
+                    if (index === current) { return; }
+                    current = index;
+                    group.clearLayers();
+                    L.geoJSON(levels[index].geojson, {
+                        style: function (feature) {
+                            return {fillColor: feature.properties.color, fillOpacity: 0.7, color: '#555555',
+                                    weight: 0.5, opacity: 0.6};
+                        },
+                        onEachFeature: function (feature, layer) {
+                            layer.bindTooltip(tooltip(feature.properties), {sticky: true});
+                        }
+                    }).addTo(group);
+                }
+
+                map.on('zoomend', render);
+                render();
+            })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, levels, group):
+        super().__init__()
+        self._name = 'ZoomTieredHexbins'
+        self.levels = levels
+        self.group = group
@@ -0,0 +1,243 @@
+import heapq
+import json
+
+import numpy as np
+import pandas as pd
+
+from track.data import DATASETS, dataset_hash, load_dataset, load_derived
+from track.distances import DESTINATION_UIC, ORIGIN_UIC, haversine_km, station_coordinates_by_uic
+from track.railway import simplify_geometry
+
+# Line vertices closer than this grid step (degrees, ~10 m) are merged into one graph node
+NODE_GRID = 1e-4
+# Geometries are simplified before building the graph; rail distances move by a few meters at most
+GRAPH_TOLERANCE = 0.0003
+# Stations farther than this from every line vertex are left out of the graph
+SNAP_RADIUS_KM = 1.0
+# Cell size (degrees) of the grid used to find the vertex nearest to each station
+_SNAP_CELL = 0.02
+
+# Graphs already loaded by this process, by source file hashes
+_networks = {}
+
+
+# Vertices and segments of every line section, with shared vertices merged into one node
+def _vertex_graph(lines):
+    points, segment_starts = [], []
+    offset = 0
+    for geometry in lines['geometry']:
+        geometry = simplify_geometry(json.loads(geometry), GRAPH_TOLERANCE, 6)
+        parts = [geometry['coordinates']] if geometry['type'] == 'LineString' else geometry['coordinates']
+        for part in parts:
+            part = np.asarray(part, dtype='float64')[:, :2]
+            points.append(part)
+            segment_starts.append(np.arange(offset, offset + len(part) - 1))
+            offset += len(part)
+    points = np.concatenate(points) if points else np.empty((0, 2))
+    segment_starts = np.concatenate(segment_starts) if segment_starts else np.empty(0, dtype='int64')
+
+    # Merge vertices falling in the same grid cell
+    cells = np.round(points / NODE_GRID).astype('int64')
+    _, first, vertex_node = np.unique(cells[:, 0] * 4_000_000 + cells[:, 1], return_index=True, return_inverse=True)
+    lon, lat = points[first, 0], points[first, 1]
+
+    src, dst = vertex_node[segment_starts], vertex_node[segment_starts + 1]
+    km = haversine_km(lat[src], lon[src], lat[dst], lon[dst])
+    return lat, lon, _undirected_edges(src, dst, km)
+
+
+# Both directions of every edge, without self-loops and keeping the shortest of parallel edges,
+# sorted by source node so the destination and length columns are the CSR arrays of the graph
+def _undirected_edges(src, dst, km):
+    edges = pd.DataFrame({'src': np.r_[src, dst], 'dst': np.r_[dst, src], 'km': np.r_[km, km]})
+    edges = edges[edges['src'] != edges['dst']]
+    edges = edges.sort_values(['src', 'dst', 'km']).drop_duplicates(['src', 'dst'])
+    return edges.astype({'src': 'int32', 'dst': 'int32', 'km': 'float64'}).reset_index(drop=True)
+
+
+def _row_offsets(src, node_count):
+    return np.r_[0, np.cumsum(np.bincount(src, minlength=node_count))]
+
+
+# Nearest node of every station, searched in the 3x3 grid cells around it
+def _snap_stations(stations, lat, lon):
+    coordinates = station_coordinates_by_uic(stations)
+    node_cells = np.floor(lon / _SNAP_CELL).astype('int64') * 100_000 + np.floor(lat / _SNAP_CELL).astype('int64')
+    order = np.argsort(node_cells, kind='stable')
+    sorted_cells = node_cells[order]
+
+    rows = []
+    for uic, station_lat, station_lon in coordinates.itertuples():
+        col, row = int(np.floor(station_lon / _SNAP_CELL)), int(np.floor(station_lat / _SNAP_CELL))
+        candidates = np.concatenate([
+            order[np.searchsorted(sorted_cells, cell, 'left'):np.searchsorted(sorted_cells, cell, 'right')]
+            for cell in ((col + dc) * 100_000 + row + dr for dc in (-1, 0, 1) for dr in (-1, 0, 1))
+        ])
+        if not len(candidates):
+            continue
+        km = haversine_km(station_lat, station_lon, lat[candidates], lon[candidates])
+        nearest = int(np.argmin(km))
+        if km[nearest] <= SNAP_RADIUS_KM:
+            rows.append((uic, candidates[nearest], km[nearest]))
+    return pd.DataFrame(rows, columns=['uic', 'node', 'snap_km']).astype({'uic': 'int64', 'node': 'int32'})
+
+
+# Replace every chain of degree-2 vertices by a single edge between the nodes kept at its ends
+# (junctions, line ends and station nodes), which leaves a graph of a few thousand nodes
+def _contract(edges, node_count, keep):
+    src, dst, km = (edges[column].to_numpy() for column in ('src', 'dst', 'km'))
+    offsets = _row_offsets(src, node_count)
+    keep = keep | (np.diff(offsets) != 2)
+
+    chains = []
+    for node in np.flatnonzero(keep):
+        for edge in range(offsets[node], offsets[node + 1]):
+            previous, current, length = node, dst[edge], km[edge]
+            while not keep[current]:
+                first = offsets[current]
+                following = dst[first] if dst[first] != previous else dst[first + 1]
+                length += km[first] if dst[first] != previous else km[first + 1]
+                previous, current = current, following
+            chains.append((node, current, length))
+
+    kept = np.flatnonzero(keep)
+    relabel = np.full(node_count, -1, dtype='int64')
+    relabel[kept] = np.arange(len(kept))
+    chains = np.array(chains, dtype='float64').reshape(-1, 3)
+    contracted = _undirected_edges(relabel[chains[:, 0].astype('int64')], relabel[chains[:, 1].astype('int64')],
+                                   chains[:, 2])
+    return kept, relabel, contracted
+
+
+# Nodes, CSR edges and station snapping of the railway network, built from the line geometries
+def _build_graph(lines, stations):
+    lat, lon, edges = _vertex_graph(lines)
+    snapped = _snap_stations(stations, lat, lon)
+
+    keep = np.zeros(len(lat), dtype=bool)
+    keep[snapped['node'].to_numpy()] = True
+    kept, relabel, edges = _contract(edges, len(lat), keep)
+
+    nodes = pd.DataFrame({'latitude': lat[kept], 'longitude': lon[kept]})
+    snapped['node'] = relabel[snapped['node'].to_numpy()].astype('int32')
+    return nodes, edges, snapped
+
+
+_graph_builds = {}
+
+
+# The three tables are persisted separately but built together, once per source version
+def _graph_table(part):
+    def build(previous):
+        key = (dataset_hash("railway_lines"), dataset_hash("stations"))
+        if key not in _graph_builds:
+            _graph_builds.clear()
+            _graph_builds[key] = _build_graph(load_dataset("railway_lines"), load_dataset("stations"))
+        return _graph_builds[key][part]
+    return build
+
+
+def load_graph_tables():
+    sources = ["railway_lines", "stations"]
+    tables = tuple(load_derived(f"railway_graph_{name}", sources, _graph_table(part))
+                   for part, name in enumerate(('nodes', 'edges', 'stations')))
+    _graph_builds.clear()
+    return tables
+
+
+# Railway network in CSR form: the edges leaving node i are indices[indptr[i]:indptr[i + 1]]
+# with lengths weights[indptr[i]:indptr[i + 1]]. Stations are addressed by UIC code.
+class RailNetwork:
+    def __init__(self, nodes, edges, stations):
+        self.latitude = nodes['latitude'].to_numpy()
+        self.longitude = nodes['longitude'].to_numpy()
+        self.indptr = _row_offsets(edges['src'].to_numpy(), len(nodes))
+        self.indices = edges['dst'].to_numpy()
+        self.weights = edges['km'].to_numpy()
+        self.station_nodes = dict(zip(stations['uic'].tolist(), stations['node'].tolist()))
+
+    def __contains__(self, uic):
+        return uic in self.station_nodes
+
+    # A* search between two stations; rail distances are never shorter than the great-circle distance,
+    # so it is an admissible heuristic. Returns (km, nodes on the path), or (nan, []) when unreachable.
+    def shortest_path(self, origin_uic, destination_uic):
+        if origin_uic not in self or destination_uic not in self:
+            return float('nan'), []
+        source, target = self.station_nodes[origin_uic], self.station_nodes[destination_uic]
+        remaining = haversine_km(self.latitude, self.longitude, self.latitude[target], self.longitude[target])
+
+        distance = {source: 0.0}
+        parent = {source: -1}
+        queue = [(remaining[source], 0.0, source)]
+        while queue:
+            _, km, node = heapq.heappop(queue)
+            if node == target:
+                path = [node]
+                while parent[path[-1]] != -1:
+                    path.append(parent[path[-1]])
+                return float(km), path[::-1]
+            if km > distance[node]:
+                continue
+            for edge in range(self.indptr[node], self.indptr[node + 1]):
+                neighbor, length = int(self.indices[edge]), km + self.weights[edge]
+                if length < distance.get(neighbor, float('inf')):
+                    distance[neighbor] = length
+                    parent[neighbor] = node
+                    heapq.heappush(queue, (length + remaining[neighbor], length, neighbor))
+        return float('nan'), []
+
+    # Dijkstra from one station, stopped once every requested station is settled
+    def distances_from(self, origin_uic, destination_uics):
+        result = dict.fromkeys(destination_uics, float('nan'))
+        if origin_uic not in self:
+            return result
+        targets = {}
+        for uic in destination_uics:
+            if uic in self:
+                targets.setdefault(self.station_nodes[uic], []).append(uic)
+
+        distance = {}
+        queue = [(0.0, self.station_nodes[origin_uic])]
+        while queue and targets:
+            km, node = heapq.heappop(queue)
+            if node in distance:
+                continue
+            distance[node] = km
+            for uic in targets.pop(node, []):
+                result[uic] = float(km)
+            for edge in range(self.indptr[node], self.indptr[node + 1]):
+                neighbor = int(self.indices[edge])
+                if neighbor not in distance:
+                    heapq.heappush(queue, (km + self.weights[edge], neighbor))
+        return result
+
+
+def load_rail_network():
+    digest = dataset_hash("railway_lines") + dataset_hash("stations")
+    if digest not in _networks:
+        _networks.clear()
+        _networks[digest] = RailNetwork(*load_graph_tables())
+    return _networks[digest]
+
+
+# The line geometries are optional: without them, fares fall back to great-circle distances
+def rail_network_available():
+    return DATASETS["railway_lines"].path.exists()
+
+
+# Rail distance of every distinct (origin UIC, destination UIC) pair of the tariff table,
+# with one Dijkstra per origin station. Pairs off the network get NaN.
+def _build_rail_distances(prices, network):
+    pairs = prices[[ORIGIN_UIC, DESTINATION_UIC]].drop_duplicates().reset_index(drop=True)
+    distances = np.full(len(pairs), np.nan)
+    for origin, rows in pairs.groupby(ORIGIN_UIC).indices.items():
+        by_destination = network.distances_from(origin, pairs[DESTINATION_UIC].to_numpy()[rows].tolist())
+        distances[rows] = list(by_destination.values())
+    pairs['Rail distance (km)'] = np.round(distances, 1)
+    return pairs
+
+
+def load_rail_distances():
+    return load_derived("route_rail_distances", ["prices", "stations", "railway_lines"],
+                        lambda previous: _build_rail_distances(load_dataset("prices"), load_rail_network()))
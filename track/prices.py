@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+
+from track.data import dataset_hash, load_dataset, load_derived
+from track.distances import DESTINATION_UIC, ORIGIN_UIC, load_route_distances
+from track.network import load_rail_distances, rail_network_available
+from track.streaming import RunningAggregate, read_chunks
+
+# Estimated distances (km) for common station pairs
+ROUTE_DISTANCES = {
+    ('AEROPORT CDG2 TGV ROISSY', 'MARSEILLE ST CHARLES'): 775,
+    ('AEROPORT CDG2 TGV ROISSY', 'MONTPELLIER SUD DE FRANCE'): 750,
+    ('AIX EN PROVENCE TGV', 'LYON-SAINT EXUPERY TGV'): 315,
+    ('MARNE LA VALLEE CHESSY', 'AIX EN PROVENCE TGV'): 690,
+    ('MARNE LA VALLEE CHESSY', 'POITIERS'): 350,
+    ('PARIS MONTPARNASSE 1 ET 2', 'BORDEAUX ST JEAN'): 580,
+    ('LYON PART DIEU', 'MARSEILLE ST CHARLES'): 315,
+    ('LYON PART DIEU', 'PARIS GARE DE LYON'): 450,
+    ('PARIS GARE DE LYON', 'NICE VILLE'): 935,
+    ('PARIS GARE DE LYON', 'MARSEILLE ST CHARLES'): 775,
+    ('PARIS GARE DE LYON', 'MONTPELLIER SUD DE FRANCE'): 745,
+    ('PARIS GARE DE LYON', 'LYON PART DIEU'): 465,
+    ('LYON PART DIEU', 'NICE VILLE'): 470,
+    ('BORDEAUX ST JEAN', 'TOULOUSE MATABIAU'): 240,
+    ('MARSEILLE ST CHARLES', 'TOULON'): 64,
+    ('MARSEILLE ST CHARLES', 'AIX EN PROVENCE TGV'): 30,
+    ('TOULOUSE MATABIAU', 'MONTPELLIER ST ROCH'): 245,
+    ('PARIS GARE DE L\'EST', 'STRASBOURG'): 490,
+    ('PARIS GARE DE L\'EST', 'REIMS'): 145,
+    ('PARIS MONTPARNASSE 1 ET 2', 'RENNES'): 350,
+    ('PARIS MONTPARNASSE 1 ET 2', 'NANTES'): 385,
+    ('PARIS GARE DU NORD', 'LILLE EUROPE'): 225,
+    ('LILLE EUROPE', 'LONDON ST PANCRAS'): 320,
+    ('PARIS GARE DE LYON', 'GENEVA'): 410,
+    ('PARIS GARE DE LYON', 'MILAN'): 850,
+    ('NICE VILLE', 'MILAN'): 320,
+    ('PARIS GARE DE LYON', 'ZURICH'): 655,
+    ('LYON PART DIEU', 'GENEVA'): 150,
+    ('LYON PART DIEU', 'BARCELONA SANTS'): 650,
+    ('MARSEILLE ST CHARLES', 'BARCELONA SANTS'): 510,
+    ('PARIS GARE DU NORD', 'BRUSSELS MIDI'): 315,
+    ('PARIS GARE DU NORD', 'AMSTERDAM'): 520,
+    ('MARNE LA VALLEE CHESSY', 'STRASBOURG'): 430,
+    ('STRASBOURG', 'ZURICH'): 225,
+    ('PARIS MONTPARNASSE 1 ET 2', 'LA ROCHELLE'): 480,
+    ('PARIS MONTPARNASSE 1 ET 2', 'ANGERS ST LAUD'): 295,
+    ('BORDEAUX ST JEAN', 'BAYONNE'): 185,
+    ('BORDEAUX ST JEAN', 'PAU'): 225,
+    ('TOULOUSE MATABIAU', 'PAU'): 210,
+    ('NIMES', 'MONTPELLIER ST ROCH'): 55,
+    ('LYON PART DIEU', 'DIJON VILLE'): 195,
+    ('DIJON VILLE', 'PARIS GARE DE LYON'): 315,
+    ('DIJON VILLE', 'STRASBOURG'): 330,
+    ('LILLE EUROPE', 'BRUSSELS MIDI'): 110,
+    ('NICE VILLE', 'MARSEILLE ST CHARLES'): 200,
+    ('NICE VILLE', 'TOULON'): 150,
+    ('NIMES', 'AVIGNON TGV'): 45,
+    ('AVIGNON TGV', 'MARSEILLE ST CHARLES'): 85,
+    ('LYON PART DIEU', 'GRENOBLE'): 105,
+    ('PARIS GARE DE LYON', 'GRENOBLE'): 600,
+    ('PARIS MONTPARNASSE 1 ET 2', 'LE MANS'): 210,
+    ('PARIS MONTPARNASSE 1 ET 2', 'BREST'): 590,
+    ('PARIS GARE DE L\'EST', 'LUXEMBOURG'): 375,
+    ('PARIS GARE DE LYON', 'TOULOUSE MATABIAU'): 675,
+    ('LILLE EUROPE', 'LYON PART DIEU'): 670,
+    ('PARIS GARE DE LYON', 'VALENCE TGV'): 465
+}
+
+
+# Columns of the per-route fare summary
+SUMMARY_KEYS = ['Gare origine', 'Destination', 'Transporteur', 'Profil tarifaire']
+
+# Bump when ROUTE_DISTANCES or the way distances are picked changes so the cached priced routes are rebuilt
+ROUTE_DISTANCES_VERSION = 3
+
+
+# Route table indexed by (origin, destination) covering both directions of every pair.
+# A pair listed explicitly wins over the reverse of another pair, as with the former dict lookups.
+def route_distance_table(distances=ROUTE_DISTANCES):
+    forward = pd.DataFrame([(origin, destination, km) for (origin, destination), km in distances.items()],
+                           columns=['Gare origine', 'Destination', 'Distance (km)'])
+    reverse = forward.rename(columns={'Gare origine': 'Destination', 'Destination': 'Gare origine'})
+    routes = pd.concat([forward, reverse], ignore_index=True)
+    routes = routes.drop_duplicates(subset=['Gare origine', 'Destination'], keep='first')
+    return routes.set_index(['Gare origine', 'Destination']).sort_index()
+
+
+# Fares with their route distance and cost per km. Distances are rail distances over the network when
+# the line geometries are available, else great-circle distances between the stations resolved from
+# the UIC codes; ROUTE_DISTANCES only fills in pairs whose codes are unknown.
+def _build_priced_routes(prices, route_distances, rail_distances=None):
+    priced = prices.merge(route_distances, on=[ORIGIN_UIC, DESTINATION_UIC], how='left')
+    if rail_distances is not None:
+        priced = priced.merge(rail_distances, on=[ORIGIN_UIC, DESTINATION_UIC], how='left')
+        priced['Distance (km)'] = priced.pop('Rail distance (km)').fillna(priced['Distance (km)'])
+    estimates = route_distance_table()['Distance (km)'].astype('float64')
+    fallback = estimates.reindex(pd.MultiIndex.from_arrays([priced['Gare origine'].astype(str),
+                                                            priced['Destination'].astype(str)]))
+    priced['Distance (km)'] = priced['Distance (km)'].fillna(pd.Series(fallback.to_numpy(), index=priced.index))
+
+    # Drop rows where distance is not available
+    priced = priced.dropna(subset=['Distance (km)'])
+    priced = priced[priced['Distance (km)'] > 0]
+
+    priced['Cost per km (Min)'] = priced['Prix minimum'] / priced['Distance (km)']
+    priced['Cost per km (Max)'] = priced['Prix maximum'] / priced['Distance (km)']
+    return priced
+
+
+def _priced_route_sources():
+    return ["prices", "stations"] + (["railway_lines"] if rail_network_available() else [])
+
+
+def load_priced_routes():
+    sources = _priced_route_sources()
+    return load_derived("priced_routes", sources,
+                        lambda previous: _build_priced_routes(
+                            load_dataset("prices"), load_route_distances(),
+                            load_rail_distances() if "railway_lines" in sources else None),
+                        version=ROUTE_DISTANCES_VERSION)
+
+
+# Cheapest and most expensive fare per route, carrier and fare profile, folded chunk by chunk from the
+# tariff file so its size does not matter
+def _build_route_price_ranges():
+    ranges = RunningAggregate(SUMMARY_KEYS, {'Prix minimum': ('Prix minimum', 'min'),
+                                             'Prix maximum': ('Prix maximum', 'max')})
+    for chunk in read_chunks("prices", SUMMARY_KEYS + ['Prix minimum', 'Prix maximum']):
+        ranges.update(chunk)
+    return ranges.result().reset_index().astype({key: str for key in SUMMARY_KEYS})
+
+
+def load_route_price_ranges():
+    return load_derived("route_price_ranges", ["prices"], lambda previous: _build_route_price_ranges())
+
+
+# (start, stop) row range of every (origin, destination) route in a frame sorted by route
+def _route_ranges(frame):
+    origins = frame['Gare origine'].astype(str).to_numpy()
+    destinations = frame['Destination'].astype(str).to_numpy()
+    starts = np.flatnonzero(np.r_[True, (origins[1:] != origins[:-1]) | (destinations[1:] != destinations[:-1])])
+    stops = np.r_[starts[1:], len(origins)]
+    return {(origins[start], destinations[start]): (start, stop) for start, stop in zip(starts, stops)}
+
+
+# Origin -> destinations adjacency and per-route row ranges over a fare table sorted by route,
+# so selectors only offer existing pairs and a route lookup is a dict hit plus a slice.
+class RouteIndex:
+    def __init__(self, prices, summary=None):
+        self.prices = prices.sort_values(['Gare origine', 'Destination'], kind='stable').reset_index(drop=True)
+        self._ranges = _route_ranges(self.prices)
+
+        self.destinations = {}
+        for origin, destination in self._ranges:
+            self.destinations.setdefault(origin, []).append(destination)
+        self.origins = sorted(self.destinations)
+
+        # Cheapest and most expensive fare per route, carrier and fare profile
+        if summary is None:
+            summary = (self.prices
+                       .groupby(SUMMARY_KEYS, observed=True)
+                       .agg({'Prix minimum': 'min', 'Prix maximum': 'max'})
+                       .reset_index())
+        self.summary = summary
+        self._summary_ranges = _route_ranges(self.summary)
+
+    def __contains__(self, route):
+        return route in self._ranges
+
+    def route(self, origin, destination):
+        start, stop = self._ranges.get((origin, destination), (0, 0))
+        return self.prices.iloc[start:stop]
+
+    def route_summary(self, origin, destination):
+        start, stop = self._summary_ranges.get((origin, destination), (0, 0))
+        summary = self.summary.iloc[start:stop][['Transporteur', 'Profil tarifaire', 'Prix minimum', 'Prix maximum']]
+        return summary.reset_index(drop=True)
+
+
+# Route indexes already built by this process, by table name and source hash
+_route_indexes = {}
+
+
+def load_route_index(name="prices"):
+    # Index over the raw fares ("prices") or over the fares with a distance ("priced_routes")
+    sources = _priced_route_sources() if name == "priced_routes" else ["prices"]
+    digest = ''.join(dataset_hash(source) for source in sources)
+    key = (name, digest)
+    if key not in _route_indexes:
+        for old in [k for k in _route_indexes if k[0] == name]:
+            del _route_indexes[old]
+        if name == "priced_routes":
+            _route_indexes[key] = RouteIndex(load_priced_routes())
+        else:
+            _route_indexes[key] = RouteIndex(load_dataset("prices"), load_route_price_ranges())
+    return _route_indexes[key]
@@ -0,0 +1,107 @@
+import functools
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("track.profiling")
+
+# By default only the step timings are taken and each rerun is logged at DEBUG. TRACK_PROFILE=1 also
+# measures the memory of every step and of the process, shows the breakdown of every rerun in the sidebar
+# and prints the rerun logs to stderr (at INFO).
+ENABLED = os.environ.get("TRACK_PROFILE") == "1"
+if ENABLED and not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+_LOG_LEVEL = logging.INFO if ENABLED else logging.DEBUG
+
+# Steps kept per thread at most, for threads that never report (e.g. background prewarming)
+MAX_STEPS = 500
+
+_PAGE_SIZE = mmap.PAGESIZE
+_state = threading.local()
+
+
+# Resident memory of the process in bytes, None where /proc is not available
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+# Proportional set size in bytes: pages mapped by several processes (the shared cache files) count for a
+# share each, so the sum over the server processes is their real memory use. None without smaps_rollup.
+def current_pss():
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, IndexError, ValueError):
+        pass
+    return None
+
+
+def _steps():
+    if not hasattr(_state, 'steps'):
+        _state.steps, _state.depth, _state.page, _state.started = [], 0, None, time.perf_counter()
+    return _state.steps
+
+
+# Start a new breakdown for a page rerun (Streamlit runs each session's script in its own thread)
+def begin(page):
+    _steps().clear()
+    _state.depth, _state.page, _state.started = 0, page, time.perf_counter()
+
+
+# Time a step of the current rerun, along with the change of resident memory when profiling is on. Steps nest.
+@contextmanager
+def timed(step):
+    steps = _steps()
+    record = {'step': step, 'depth': _state.depth, 'ms': None, 'rss_delta_mb': None}
+    if len(steps) >= MAX_STEPS:
+        del steps[:len(steps) - MAX_STEPS + 1]
+    steps.append(record)
+    rss = current_rss() if ENABLED else None
+    start = time.perf_counter()
+    _state.depth += 1
+    try:
+        yield record
+    finally:
+        _state.depth -= 1
+        record['ms'] = round((time.perf_counter() - start) * 1000, 2)
+        if rss is not None:
+            record['rss_delta_mb'] = round((current_rss() - rss) / 2 ** 20, 2)
+
+
+# Decorator form of timed(); the step is named after the function and its first argument
+def profiled(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        step = f"{function.__name__}({args[0]})" if args and isinstance(args[0], str) else function.__name__
+        with timed(step):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+# Breakdown of the current rerun, logged as one JSON line
+def finish():
+    steps = list(_steps())
+    rss = current_rss() if ENABLED else None
+    pss = current_pss() if ENABLED else None
+    report = {
+        'page': getattr(_state, 'page', None),
+        'total_ms': round((time.perf_counter() - _state.started) * 1000, 2),
+        'rss_mb': round(rss / 2 ** 20, 1) if rss is not None else None,
+        'pss_mb': round(pss / 2 ** 20, 1) if pss is not None else None,
+        'steps': steps,
+    }
+    if logger.isEnabledFor(_LOG_LEVEL):
+        logger.log(_LOG_LEVEL, json.dumps(report, ensure_ascii=False))
+    _steps().clear()
+    return report
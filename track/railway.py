@@ -0,0 +1,166 @@
+import json
+import math
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from track.assets import publish_static
+from track.data import dataset_hash, load_dataset, load_derived
+
+# Color mapping for 'catlig' values
+COLOR_MAPPING = {
+    'Ligne du réseau conventionnel': 'green',
+    'Ligne à grande vitesse': 'blue'
+}
+
+# Figures shown under the Railway lines map
+LineSummary = namedtuple('LineSummary', ['total_length', 'category_counts'])
+
+# Summaries already computed by this process, by source file hash
+_summaries = {}
+
+# Fields shown in the line tooltips, with their aliases
+TOOLTIP_ALIASES = {
+    'lib_ligne': 'Line Name:',
+    'catlig': 'Category:',
+    'longueur': 'Length (km):'
+}
+
+# Simplification tiers: up to `max_zoom`, geometries are simplified with Douglas-Peucker at `tolerance`
+# (in degrees of latitude, 1° ≈ 111 km: about 1.1 km, 220 m and 33 m) and coordinates rounded to `decimals`
+ZOOM_TIERS = [
+    {'max_zoom': 6, 'tolerance': 0.01, 'decimals': 3},
+    {'max_zoom': 9, 'tolerance': 0.002, 'decimals': 4},
+    {'max_zoom': 30, 'tolerance': 0.0003, 'decimals': 5},
+]
+
+# Longitude degrees are shorter than latitude degrees in France; scale them before measuring distances
+_LONGITUDE_SCALE = math.cos(math.radians(46.6))
+
+
+# Kilometer value before '+' or '-' of PKs such as '012+345', <NA> when it cannot be parsed
+def parse_pk(values):
+    kilometers = values.astype('string').str.extract(r'^\s*(\d+)\s*(?:[+-]|$)', expand=False)
+    return pd.to_numeric(kilometers).astype('Int32')
+
+
+# Indices of the vertices kept by Douglas-Peucker; the farthest vertex of each span is found with NumPy
+def douglas_peucker(points, tolerance):
+    count = len(points)
+    if count < 3:
+        return np.arange(count)
+
+    scaled = points * np.array([_LONGITUDE_SCALE, 1.0])
+    keep = np.zeros(count, dtype=bool)
+    keep[[0, -1]] = True
+    spans = [(0, count - 1)]
+    while spans:
+        start, end = spans.pop()
+        if end - start < 2:
+            continue
+        first, last = scaled[start], scaled[end]
+        inner = scaled[start + 1:end]
+        direction = last - first
+        length = np.hypot(*direction)
+        if length == 0:
+            distances = np.hypot(*(inner - first).T)
+        else:
+            distances = np.abs(direction[0] * (inner[:, 1] - first[1]) - direction[1] * (inner[:, 0] - first[0]))
+            distances /= length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            spans.append((start, split))
+            spans.append((split, end))
+    return np.flatnonzero(keep)
+
+
+def simplify_geometry(geometry, tolerance, decimals):
+    def simplify_line(coordinates):
+        points = np.asarray(coordinates, dtype='float64')[:, :2]
+        return np.round(points[douglas_peucker(points, tolerance)], decimals).tolist()
+
+    if geometry['type'] == 'LineString':
+        return {'type': 'LineString', 'coordinates': simplify_line(geometry['coordinates'])}
+    if geometry['type'] == 'MultiLineString':
+        return {'type': 'MultiLineString', 'coordinates': [simplify_line(line) for line in geometry['coordinates']]}
+    return geometry
+
+
+# One row per line section: its parsed PKs, length and category, and the row of its geometry in "railway_lines"
+def _build_line_table(lines):
+    table = pd.DataFrame({'feature': np.arange(len(lines), dtype='int32')})
+    for column in ('code_ligne', 'lib_ligne', 'catlig'):
+        table[column] = lines[column] if column in lines else None
+    # A section without a PK property starts or ends at kilometer 0
+    table['pk_start'] = parse_pk(lines['pkd']) if 'pkd' in lines else pd.array([0] * len(lines), dtype='Int32')
+    table['pk_end'] = parse_pk(lines['pkf']) if 'pkf' in lines else pd.array([0] * len(lines), dtype='Int32')
+    table['longueur'] = table['pk_end'] - table['pk_start']
+    return table
+
+
+def load_line_table():
+    return load_derived("railway_line_table", ["railway_lines"],
+                        lambda previous: _build_line_table(load_dataset("railway_lines")))
+
+
+# Total length and number of sections per category, computed once per source file
+def load_line_summary():
+    digest = dataset_hash("railway_lines")
+    if digest not in _summaries:
+        table = load_line_table()
+        counts = table['catlig'].value_counts().reindex(list(COLOR_MAPPING), fill_value=0)
+        _summaries.clear()
+        _summaries[digest] = LineSummary(int(table['longueur'].sum()), counts.rename_axis('Category'))
+    return _summaries[digest]
+
+
+# One merged FeatureCollection per (zoom tier, catlig), serialized as JSON text
+def _build_line_tiers(lines, table):
+    lengths = table['longueur'].astype('object').where(table['longueur'].notna(), None).tolist()
+    geometries = [json.loads(geometry) for geometry in lines['geometry']]
+
+    rows = []
+    for tier, settings in enumerate(ZOOM_TIERS):
+        for category in COLOR_MAPPING:
+            features = [
+                {
+                    'type': 'Feature',
+                    'geometry': simplify_geometry(geometries[i], settings['tolerance'], settings['decimals']),
+                    'properties': {'lib_ligne': table['lib_ligne'].iat[i], 'catlig': category, 'longueur': lengths[i]},
+                }
+                for i in table['feature'].to_numpy()[(table['catlig'] == category).to_numpy()]
+            ]
+            rows.append({
+                'tier': tier,
+                'max_zoom': settings['max_zoom'],
+                'catlig': category,
+                'geojson': json.dumps({'type': 'FeatureCollection', 'features': features}, separators=(',', ':')),
+            })
+    return pd.DataFrame(rows)
+
+
+def load_line_tiers():
+    return load_derived("railway_line_tiers", ["railway_lines"],
+                        lambda previous: _build_line_tiers(load_dataset("railway_lines"), load_line_table()))
+
+
+# Write the layers of every tier but the coarsest to the static directory (static/line_tiers), once per
+# version of the lines file, so the map downloads a finer tier only when the user zooms in. Returns the URL
+# of each tier file relative to the page, by tier.
+def publish_line_tiers(tiers):
+    digest = dataset_hash("railway_lines")
+    urls = {}
+    for tier, tier_rows in tiers.groupby('tier'):
+        if tier == tiers['tier'].min():
+            continue
+        urls[int(tier)] = publish_static("line_tiers", f"{digest}-{tier}.json", digest,
+                                         lambda: _tier_layers_json(tier_rows))
+    return urls
+
+
+# {category: GeoJSON} of one tier, joined from the stored GeoJSON texts without parsing them
+def _tier_layers_json(tier_rows):
+    return '{' + ','.join(f"{json.dumps(row.catlig)}:{row.geojson}" for row in tier_rows.itertuples()) + '}'
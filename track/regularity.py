@@ -0,0 +1,149 @@
+import hashlib
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from track.data import dataset_hash, load_derived
+from track.streaming import RunningSum, read_chunks
+
+CAUSE_COLUMNS = [
+    'prct_cause_externe', 'prct_cause_infra', 'prct_cause_gestion_trafic',
+    'prct_cause_materiel_roulant', 'prct_cause_gestion_gare', 'prct_cause_prise_en_charge_voyageurs'
+]
+INCIDENT_COLUMNS = ['nb_annulation', 'nb_train_depart_retard', 'nb_train_retard_arrivee']
+
+# Dimensions of the regularity cube; all its other columns are additive measures
+CUBE_KEYS = ['month', 'service', 'gare_depart', 'gare_arrivee']
+COUNT_COLUMNS = ['nb_train_prevu', 'nb_annulation', 'nb_train_depart_retard', 'nb_train_retard_arrivee',
+                 'nb_train_retard_sup_15', 'nb_train_retard_sup_30', 'nb_train_retard_sup_60']
+
+# Final tables shown by the Regularity page
+RegularitySummary = namedtuple('RegularitySummary', ['monthly_delays', 'line_incidents', 'average_causes'])
+
+# Partition fingerprints already computed by this process, by source file hash
+_fingerprints = {}
+
+
+# Fingerprint of the rows of each yearly partition, used to tell which years changed between two files.
+# Row hashes are fed chunk by chunk in file order, so the whole file is never held in memory.
+def partition_fingerprints(chunks):
+    digests = {}
+    for chunk in chunks:
+        years = chunk['date'].dt.year
+        row_hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        for year in years.dropna().unique():
+            digest = digests.setdefault(int(year), hashlib.blake2b(digest_size=16))
+            digest.update(row_hashes[(years == year).to_numpy()].tobytes())
+    return {year: digest.hexdigest() for year, digest in digests.items()}
+
+
+def load_partition_fingerprints():
+    digest = dataset_hash("regularity")
+    if digest not in _fingerprints:
+        _fingerprints.clear()
+        _fingerprints[digest] = partition_fingerprints(read_chunks("regularity"))
+    return _fingerprints[digest]
+
+
+# Aggregate only the yearly partitions that are new or changed since `previous` and reuse the others.
+# The file is streamed in chunks projected on `columns`; each chunk is reduced on arrival and the partial
+# aggregates are summed, so memory depends on the number of groups rather than on the number of rows.
+# Every aggregate table carries the 'year' and 'fingerprint' of the partition it was computed from.
+def _aggregate_partitions(previous, aggregate, columns):
+    fingerprints = load_partition_fingerprints()
+    reused = None
+    if previous is not None:
+        reused = previous[previous['fingerprint'] == previous['year'].map(fingerprints)]
+    done = reused['year'].unique() if reused is not None else []
+
+    folded = RunningSum()
+    for chunk in read_chunks("regularity", ['date'] + columns):
+        todo = chunk[~chunk['date'].dt.year.isin(done)]
+        folded.add(aggregate(todo, todo['date'].dt.year.rename('year')))
+    fresh = folded.result().reset_index()
+    fresh['year'] = fresh['year'].astype('int16')
+    fresh['fingerprint'] = fresh['year'].map(fingerprints)
+    return pd.concat([reused, fresh], ignore_index=True) if reused is not None else fresh
+
+
+# Additive measures per (month, service, origin, destination). Averages from the source rows are stored
+# as sum/count pairs and delay minutes as mean delay x late trains, so any slice can recompute them exactly.
+def _cube_partials(df, years):
+    arrival_delay = df['retard_moyen_arrivee'].astype('float64')
+    measures = {
+        'month': df['date'],
+        'service': df['service'],
+        'gare_depart': df['gare_depart'],
+        'gare_arrivee': df['gare_arrivee'],
+        **{column: df[column].astype('int64') for column in COUNT_COLUMNS},
+        'delay_sum': arrival_delay.fillna(0),
+        'delay_count': arrival_delay.notna().astype('int64'),
+        'delay_minutes': (arrival_delay * df['nb_train_retard_arrivee']).fillna(0),
+    }
+    for cause in CAUSE_COLUMNS:
+        measures[f'{cause}_sum'] = df[cause].astype('float64').fillna(0)
+        measures[f'{cause}_count'] = df[cause].notna().astype('int64')
+
+    return pd.DataFrame(measures).groupby([years] + CUBE_KEYS, observed=True, sort=True).sum()
+
+
+# The cube is built per yearly partition, so a new month only aggregates its year
+def _build_cube(previous=None):
+    cube = _aggregate_partitions(previous, _cube_partials,
+                                 CUBE_KEYS[1:] + COUNT_COLUMNS + ['retard_moyen_arrivee'] + CAUSE_COLUMNS)
+    cube = cube.astype({key: 'category' for key in CUBE_KEYS[1:]})
+    return cube.sort_values('month', kind='stable').reset_index(drop=True)
+
+
+def load_regularity_cube():
+    return load_derived("regularity_cube", ["regularity"],
+                        lambda previous: _build_cube(previous), version=2)
+
+
+# Rows of the cube matching the filters; the cube is sorted by month so the date range is a binary search
+def slice_cube(cube, start=None, end=None, service=None, origin=None, destination=None):
+    months = cube['month'].to_numpy()
+    lo = np.searchsorted(months, np.datetime64(start, 'ns'), side='left') if start is not None else 0
+    hi = np.searchsorted(months, np.datetime64(end, 'ns'), side='right') if end is not None else len(cube)
+    rows = cube.iloc[lo:hi]
+
+    mask = np.ones(len(rows), dtype=bool)
+    for column, value in (('service', service), ('gare_depart', origin), ('gare_arrivee', destination)):
+        if value is not None:
+            mask &= (rows[column] == value).to_numpy()
+    return rows[mask]
+
+
+# Final tables of the page for any slice of the cube
+def summarize_cube(rows):
+    monthly = rows.groupby('month')[['delay_sum', 'delay_count']].sum()
+    monthly_delays = pd.DataFrame({
+        'year_month': monthly.index.strftime('%Y-%m'),
+        'retard_moyen_arrivee': (monthly['delay_sum'] / monthly['delay_count']).to_numpy(),
+    })
+
+    line_incidents = rows.groupby(['gare_depart', 'gare_arrivee'], observed=True)[INCIDENT_COLUMNS].sum()
+    line_incidents = line_incidents.reset_index().astype({'gare_depart': str, 'gare_arrivee': str})
+    line_incidents['total_incidents'] = line_incidents[INCIDENT_COLUMNS].sum(axis=1)
+
+    cause_sums = rows[[f'{cause}_sum' for cause in CAUSE_COLUMNS]].sum().to_numpy()
+    cause_counts = rows[[f'{cause}_count' for cause in CAUSE_COLUMNS]].sum().to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average_causes = pd.Series(cause_sums / cause_counts, index=CAUSE_COLUMNS)
+
+    return RegularitySummary(monthly_delays, line_incidents, average_causes)
+
+
+# Headline figures of a slice, with rates and the mean delay of late trains weighted by train counts
+def cube_totals(rows):
+    totals = rows[COUNT_COLUMNS + ['delay_minutes']].sum()
+    planned = int(totals['nb_train_prevu'])
+    ran = planned - int(totals['nb_annulation'])
+    late = int(totals['nb_train_retard_arrivee'])
+    return {
+        'trains_planned': planned,
+        'cancellation_rate': totals['nb_annulation'] / planned if planned else float('nan'),
+        'late_arrival_rate': late / ran if ran else float('nan'),
+        'mean_late_arrival_delay': totals['delay_minutes'] / late if late else float('nan'),
+    }
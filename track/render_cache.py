@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from track.data import CACHE_DIR, dataset_hash
+
+# Rendered artifacts shared by the server processes, next to the dataset cache files
+RENDER_DIR = CACHE_DIR / "renders"
+
+
+# Thread-safe LRU cache of rendered artifacts (map HTML, figure JSON...) built from one dataset.
+# Every entry is dropped as soon as the source file hash of that dataset changes.
+# With `shared` (the namedtuple type of the values), entries are also written to the cache directory, so a
+# view rendered by one server process is read back by the others instead of being rendered again.
+class RenderCache:
+    def __init__(self, dataset, maxsize=64, shared=None):
+        self.dataset = dataset
+        self.maxsize = maxsize
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._digest = None
+        self._lock = threading.Lock()
+
+    def _shared_path(self, digest, key):
+        name = hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()
+        return RENDER_DIR / f"{self.dataset}-{self.shared.__name__}-{digest}" / f"{name}.json"
+
+    def _load_shared(self, digest, key):
+        try:
+            with open(self._shared_path(digest, key), encoding='utf-8') as f:
+                return self.shared(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _store_shared(self, digest, key, value):
+        path = self._shared_path(digest, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(value._asdict(), f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _drop_stale_shared(self, digest):
+        current = f"{self.dataset}-{self.shared.__name__}-{digest}"
+        for folder in RENDER_DIR.glob(f"{self.dataset}-{self.shared.__name__}-*"):
+            if folder.name != current:
+                shutil.rmtree(folder, ignore_errors=True)
+
+    def get_or_build(self, key, build):
+        digest = dataset_hash(self.dataset)
+        with self._lock:
+            if digest != self._digest:
+                self._entries.clear()
+                self._digest = digest
+                if self.shared is not None and RENDER_DIR.exists():
+                    self._drop_stale_shared(digest)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        # Build outside the lock so concurrent lookups of other keys are not blocked
+        value = self._load_shared(digest, key) if self.shared is not None else None
+        if value is None:
+            value = build()
+            if self.shared is not None:
+                self._store_shared(digest, key, value)
+
+        with self._lock:
+            if digest == self._digest:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
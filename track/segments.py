@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+# DRG station categories, each one owning a bit of the segment flags
+SEGMENTS = ('A', 'B', 'C')
+SEGMENT_BITS = {segment: 1 << position for position, segment in enumerate(SEGMENTS)}
+
+
+# Parse ';'-separated DRG segments ('B', 'A;A;B', ...) into a uint8 bitmask per station.
+# Only the few distinct values are split; missing segments give 0.
+def segment_flags(segments):
+    codes, uniques = pd.factorize(segments)
+    flags = [sum(SEGMENT_BITS.get(segment, 0) for segment in set(str(value).split(';'))) for value in uniques]
+    flags = np.array(flags + [0], dtype=np.uint8)  # code -1 (missing) picks the trailing 0
+    return pd.Series(flags[codes], index=segments.index, name='segments')
+
+
+# Boolean mask of the stations belonging to a category (stations listed in several segments match each of them)
+def segment_mask(flags, category):
+    return (flags & SEGMENT_BITS[category]) != 0
+
+
+# Categories present in at least one station, in SEGMENTS order
+def present_segments(flags):
+    combined = int(np.bitwise_or.reduce(flags.to_numpy())) if len(flags) else 0
+    return [segment for segment in SEGMENTS if combined & SEGMENT_BITS[segment]]
@@ -0,0 +1,83 @@
+import math
+
+import numpy as np
+
+from track.data import dataset_hash, load_dataset
+from track.distances import EARTH_RADIUS_KM, haversine_km
+
+# Side of the grid cells in degrees (~28 km of latitude), a few dozen stations per cell at most
+CELL_SIZE = 0.25
+_KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Indexes already built by this process, by source file hash
+_indexes = {}
+
+
+# Latitude/longitude box (south, west, north, east) enclosing a circle of `radius_km` around a location
+def radius_bounds(latitude, longitude, radius_km):
+    dlat = radius_km / _KM_PER_DEGREE
+    dlon = dlat / max(math.cos(math.radians(min(abs(latitude) + dlat, 89.9))), 1e-6)
+    return latitude - dlat, longitude - dlon, latitude + dlat, longitude + dlon
+
+
+# Uniform latitude/longitude grid over a set of points. Points are stored sorted by cell so the
+# points of a cell are the slice order[offsets[cell]:offsets[cell + 1]] (same layout as a CSR matrix).
+# Queries return positions in the arrays the index was built from.
+class GridIndex:
+    def __init__(self, latitude, longitude, cell_size=CELL_SIZE):
+        self.latitude = np.asarray(latitude, dtype='float64')
+        self.longitude = np.asarray(longitude, dtype='float64')
+        self.cell_size = cell_size
+        self.south = self.latitude.min(initial=0.0)
+        self.west = self.longitude.min(initial=0.0)
+        self.rows = int((self.latitude.max(initial=0.0) - self.south) // cell_size) + 1
+        self.cols = int((self.longitude.max(initial=0.0) - self.west) // cell_size) + 1
+
+        cells = self._row(self.latitude) * self.cols + self._col(self.longitude)
+        self.order = np.argsort(cells, kind='stable')
+        self.offsets = np.r_[0, np.cumsum(np.bincount(cells, minlength=self.rows * self.cols))]
+
+    def __len__(self):
+        return len(self.latitude)
+
+    def _row(self, latitude):
+        return np.clip(((np.asarray(latitude) - self.south) // self.cell_size).astype('int64'), 0, self.rows - 1)
+
+    def _col(self, longitude):
+        return np.clip(((np.asarray(longitude) - self.west) // self.cell_size).astype('int64'), 0, self.cols - 1)
+
+    # Points of the cells overlapping a latitude/longitude box
+    def _candidates(self, south, west, north, east):
+        if south > self.south + self.rows * self.cell_size or north < self.south:
+            return np.empty(0, dtype='int64')
+        if west > self.west + self.cols * self.cell_size or east < self.west:
+            return np.empty(0, dtype='int64')
+        first_col, last_col = int(self._col(west)), int(self._col(east))
+        slices = [
+            self.order[self.offsets[row * self.cols + first_col]:self.offsets[row * self.cols + last_col + 1]]
+            for row in range(int(self._row(south)), int(self._row(north)) + 1)
+        ]
+        return np.concatenate(slices) if slices else np.empty(0, dtype='int64')
+
+    # Points inside a latitude/longitude box
+    def in_bounds(self, south, west, north, east):
+        candidates = self._candidates(south, west, north, east)
+        lat, lon = self.latitude[candidates], self.longitude[candidates]
+        return np.sort(candidates[(lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)])
+
+    # Points within `radius_km` of a location, nearest first, with their distances
+    def within_radius(self, latitude, longitude, radius_km):
+        candidates = self._candidates(*radius_bounds(latitude, longitude, radius_km))
+        km = haversine_km(latitude, longitude, self.latitude[candidates], self.longitude[candidates])
+        inside = km <= radius_km
+        order = np.argsort(km[inside], kind='stable')
+        return candidates[inside][order], km[inside][order]
+
+
+def load_station_index():
+    digest = dataset_hash("stations")
+    if digest not in _indexes:
+        stations = load_dataset("stations")
+        _indexes.clear()
+        _indexes[digest] = GridIndex(stations['latitude'], stations['longitude'])
+    return _indexes[digest]
@@ -0,0 +1,132 @@
+from collections import namedtuple
+
+import numpy as np
+
+from track.data import load_dataset
+from track.profiling import timed
+from track.render_cache import RenderCache
+from track.segments import present_segments, segment_mask
+from track.spatial import load_station_index, radius_bounds
+
+ALL_CATEGORIES = 'All categories'
+ALL_REGIONS = 'All regions'
+
+# Size of the map component, as with folium_static defaults
+MAP_WIDTH = 700
+MAP_HEIGHT = 500
+
+# Everything the French stations page renders for one (category, region) filter
+StationViews = namedtuple('StationViews', ['station_count', 'map_html', 'figure_json'])
+
+_views = RenderCache("stations", maxsize=64, shared=StationViews)
+# Views around a location are keyed on any position and radius a user picks: kept in memory only, so the LRU
+# bounds them, rather than in the shared directory that only the stations file hash clears
+_area_views = RenderCache("stations", maxsize=64)
+
+
+def station_categories(stations):
+    return [ALL_CATEGORIES] + present_segments(stations['segments'])
+
+
+def station_regions(stations):
+    return [ALL_REGIONS] + sorted(stations['region'].dropna().unique().tolist())
+
+
+# Rows of the stations table matching the selected category and region
+def filter_mask(stations, category, region):
+    mask = segment_mask(stations['segments'], category).to_numpy() if category != ALL_CATEGORIES \
+        else np.ones(len(stations), dtype=bool)
+    if region != ALL_REGIONS:
+        mask &= (stations['region'] == region).to_numpy()
+    return mask
+
+
+def filter_stations(stations, category, region):
+    if category == ALL_CATEGORIES and region == ALL_REGIONS:
+        return stations
+    return stations[filter_mask(stations, category, region)]
+
+
+# Map and chart libraries are only imported to render a view: views served from the render cache,
+# including the ones rendered by other server processes, never load them
+def _render_views(filtered_data, stations_map):
+    import folium
+    import plotly.express as px
+
+    from track.maps import station_markers_layer
+
+    with timed("region chart"):
+        # Count the number of stations in each region
+        region_counts = filtered_data['region'].value_counts().loc[lambda counts: counts > 0].reset_index()
+        region_counts.columns = ['Region', 'Number of Stations']
+
+        # Plotting the number of stations per region using Plotly
+        fig = px.bar(region_counts, x='Region', y='Number of Stations', color='Region',
+                     title='Number of Stations by Region',
+                     labels={'Number of Stations': 'Number of Stations', 'Region': 'Region'})
+        figure_json = fig.to_json()
+
+    # Add the markers to the map as one clustered layer
+    with timed("marker layer"):
+        station_markers_layer(filtered_data).add_to(stations_map)
+    with timed("map render"):
+        map_html = folium.Figure().add_child(stations_map).render()
+
+    return StationViews(len(filtered_data), map_html, figure_json)
+
+
+def build_station_views(stations, category, region):
+    import folium
+
+    with timed("filter stations"):
+        filtered_data = filter_stations(stations, category, region)
+    return _render_views(filtered_data, folium.Map(location=[46.603354, 1.888334], zoom_start=6))
+
+
+# Views limited to the area around a location: the map opens on the circle of `radius_km` and only
+# the stations inside its viewport are sent to the browser
+def build_area_views(stations, category, region, latitude, longitude, radius_km):
+    import folium
+
+    south, west, north, east = radius_bounds(latitude, longitude, radius_km)
+    with timed("viewport query"):
+        positions = load_station_index().in_bounds(south, west, north, east)
+        positions = positions[filter_mask(stations, category, region)[positions]]
+
+    stations_map = folium.Map(location=[latitude, longitude])
+    stations_map.fit_bounds([[south, west], [north, east]])
+    folium.Circle([latitude, longitude], radius=radius_km * 1000, color='black', weight=1, fill=False)\
+        .add_to(stations_map)
+    return _render_views(stations.iloc[positions], stations_map)
+
+
+# The k stations of the filter nearest to a location within `radius_km`, with their distance
+def nearest_stations(stations, category, region, latitude, longitude, radius_km, k=10):
+    positions, km = load_station_index().within_radius(latitude, longitude, radius_km)
+    keep = filter_mask(stations, category, region)[positions]
+    nearest = stations.iloc[positions[keep][:k]][['nom', 'segment_drg', 'region']]
+    return nearest.assign(distance_km=np.round(km[keep][:k], 1)).reset_index(drop=True)
+
+
+# Rendered views for a filter combination, built once per version of the stations file
+def get_station_views(category, region):
+    with timed("station views"):
+        return _views.get_or_build(
+            (category, region),
+            lambda: build_station_views(load_dataset("stations"), category, region),
+        )
+
+
+def get_area_views(category, region, latitude, longitude, radius_km):
+    with timed("area views"):
+        return _area_views.get_or_build(
+            (category, region, latitude, longitude, radius_km),
+            lambda: build_area_views(load_dataset("stations"), category, region, latitude, longitude, radius_km),
+        )
+
+
+def prewarm_station_views():
+    stations = load_dataset("stations")
+    for category in station_categories(stations):
+        for region in station_regions(stations):
+            get_station_views(category, region)
@@ -0,0 +1,60 @@
+import pandas as pd
+
+from track.data import DATASETS
+
+# Rows parsed at a time; memory use depends on this and on the number of groups, not on the file size
+CHUNK_ROWS = 50_000
+# Partial aggregates kept before they are folded together
+_FOLD_EVERY = 16
+
+
+# Normalized chunks of a registered CSV dataset, restricted to `columns`. The dataset's preparation
+# runs on every chunk, so it must only need the projected columns.
+def read_chunks(name, columns=None, chunksize=CHUNK_ROWS):
+    dataset = DATASETS[name]
+    if not dataset.path.exists():
+        raise FileNotFoundError(dataset.path)
+    with dataset.reader(dataset.path, usecols=columns, chunksize=chunksize) as chunks:
+        for chunk in chunks:
+            yield dataset.prepare(chunk)
+
+
+# Running group-by over a stream of chunks. `measures` maps each output column to (input column, how)
+# with how in 'sum', 'count', 'min' or 'max'; every chunk is reduced to one row per group on arrival.
+class RunningAggregate:
+    _combine = {'sum': 'sum', 'count': 'sum', 'min': 'min', 'max': 'max'}
+
+    def __init__(self, keys, measures):
+        self.keys = keys
+        self.measures = measures
+        self._parts = []
+
+    def update(self, chunk):
+        self.add(chunk.groupby(self.keys, observed=True).agg(**self.measures))
+
+    # Add a partial aggregate that is already grouped by the keys (index) with the output columns
+    def add(self, partial):
+        self._parts.append(partial)
+        if len(self._parts) >= _FOLD_EVERY:
+            self._parts = [self._fold()]
+
+    def _fold(self):
+        combined = pd.concat(self._parts)
+        how = {column: self._combine[agg] for column, (_, agg) in self.measures.items()}
+        return combined.groupby(level=list(range(combined.index.nlevels)), observed=True).agg(how)
+
+    def result(self):
+        if not self._parts:
+            return None
+        self._parts = [self._fold()]
+        return self._parts[0]
+
+
+# Additive partial aggregates (sums and counts only) folded the same way, whatever their columns
+class RunningSum(RunningAggregate):
+    def __init__(self):
+        super().__init__(None, {})
+
+    def _fold(self):
+        combined = pd.concat(self._parts)
+        return combined.groupby(level=list(range(combined.index.nlevels)), observed=True).sum()
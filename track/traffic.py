@@ -0,0 +1,62 @@
+import pandas as pd
+
+from track.data import dataset_hash, load_dataset
+from track.segments import present_segments, segment_mask
+
+# Stores already built by this process, by source file hash
+_stores = {}
+
+
+# Passenger traffic indexed by (station_id, year), built once from the long "traffic" table.
+# Stations are identified by their full UIC code since a few station names are not unique.
+class TrafficStore:
+    def __init__(self, traffic, frequentation):
+        self.stations = frequentation.set_index('code_uic_complet')[
+            ['nom_gare', 'code_postal', 'segmentation_drg', 'segments']]
+        self.stations.index.name = 'station_id'
+
+        self.traffic = traffic.set_index(['station_id', 'year']).sort_index()
+        self.years = sorted(traffic['year'].unique().tolist(), reverse=True)
+
+        # Stations ranked by passengers for each year, so top-N is a head() of a prebuilt series
+        passengers = self.traffic['passengers']
+        self._ranked = {
+            year: passengers.xs(year, level='year').sort_values(ascending=False, kind='stable')
+            for year in self.years
+        }
+
+    # Stations with a known DRG segment, optionally restricted to one category
+    def station_ids(self, category=None):
+        flags = self.stations['segments']
+        mask = segment_mask(flags, category) if category is not None else flags != 0
+        return self.stations.index[mask.to_numpy()]
+
+    def categories(self):
+        return present_segments(self.stations['segments'])
+
+    def station_name(self, station_id):
+        return self.stations.at[station_id, 'nom_gare']
+
+    def top_stations(self, year, station_ids=None, n=10):
+        ranked = self._ranked[year]
+        if station_ids is not None:
+            ranked = ranked[ranked.index.isin(station_ids)]
+        top = ranked.head(n).rename('passengers').reset_index()
+        top.insert(1, 'nom_gare', self.stations['nom_gare'].reindex(top['station_id']).to_numpy())
+        return top
+
+    def compare(self, station_ids, years):
+        rows = self.traffic.loc[pd.IndexSlice[list(station_ids), list(years)], ['passengers']].reset_index()
+        rows.insert(1, 'nom_gare', self.stations['nom_gare'].reindex(rows['station_id']).to_numpy())
+        return rows
+
+    def trend(self, station_id):
+        return self.traffic.loc[station_id, ['passengers', 'total_with_non_passengers']].reset_index()
+
+
+def load_traffic_store():
+    digest = dataset_hash("traffic")
+    if digest not in _stores:
+        _stores.clear()
+        _stores[digest] = TrafficStore(load_dataset("traffic"), load_dataset("frequentation"))
+    return _stores[digest]
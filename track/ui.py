@@ -0,0 +1,29 @@
+import pandas as pd
+import streamlit as st
+
+from track import profiling
+from track.data import load_dataset
+
+
+# Load a registered dataset for a page, reporting a missing source file instead of failing
+def load_data(name):
+    try:
+        return load_dataset(name)
+    except FileNotFoundError:
+        st.error("Data file not found.")
+        return pd.DataFrame()  # Return an empty DataFrame
+
+
+# Log the timing breakdown of this rerun; with TRACK_PROFILE=1 or ?profile=1 in the URL it is also
+# shown in a sidebar panel (memory figures are only measured with TRACK_PROFILE=1)
+def show_profile():
+    report = profiling.finish()
+    if profiling.ENABLED or st.query_params.get("profile") == "1":
+        with st.sidebar.expander("Performance of this rerun"):
+            memory = (f", resident memory: {report['rss_mb']} MB (proportional: {report['pss_mb']} MB)"
+                      if report['rss_mb'] is not None else "")
+            st.write(f"Total: {report['total_ms']:.0f} ms{memory}")
+            steps = pd.DataFrame(report['steps'], columns=['step', 'depth', 'ms', 'rss_delta_mb'])
+            steps['step'] = [' ' * (2 * depth) + step for step, depth in zip(steps['step'], steps['depth'])]
+            columns = ['step', 'ms'] + (['rss_delta_mb'] if profiling.ENABLED else [])
+            st.dataframe(steps[columns], hide_index=True)
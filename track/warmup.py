@@ -0,0 +1,255 @@
+# Warm-up of every dataset and derived table, launched once per server process from the Home page:
+#
+#   1. the source files are parsed and normalized in parallel worker processes, which write the Arrow
+#      cache files (files already cached for the current sources are only checked);
+#   2. the derived tables are built in parallel, one group of dependent tables per worker;
+#   3. the tables combining several groups (station ids, origin-destination table) are built;
+#   4. this process maps the cache files and builds its in-memory indexes, so the first visit of each
+#      page only renders.
+#
+#   python -m track.warmup      # same stages in the foreground, e.g. as a deploy step
+#
+# The workers are `python -m track.warmup --worker` subprocesses rather than multiprocessing workers:
+# Streamlit installs the running page as the __main__ module, which spawned workers would import and run
+# again (and forking a server process running other threads is not safe).
+#
+# The stages only fill the cache directory and the per-process memos the pages read anyway, so a page
+# visited during the warm-up works as before (the per-table build locks make it wait for a table being
+# built rather than build it twice).
+import argparse
+import importlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+logger = logging.getLogger("track.warmup")
+
+# TRACK_WARMUP=0 leaves every table to be loaded by the first page needing it
+ENABLED = os.environ.get("TRACK_WARMUP", "1") != "0"
+
+# Stages run in worker processes after the parsing of every registered dataset: groups of loaders
+# ("module:function") run in parallel, the loaders of a group in order. A group whose source files are
+# missing is skipped.
+PROCESS_STAGES = [
+    ("derive", {
+        "regularity": (["regularity"], ["track.regularity:load_regularity_cube",
+                                        "track.anomalies:load_anomaly_scores"]),
+        "railway": (["railway_lines"], ["track.railway:load_line_table", "track.railway:load_line_tiers",
+                                        "track.network:load_graph_tables", "track.network:load_rail_distances"]),
+        # The priced routes wait for the rail distances of the group above through the build lock
+        "prices": (["prices", "stations"], ["track.distances:load_route_distances",
+                                            "track.prices:load_route_price_ranges",
+                                            "track.prices:load_priced_routes"]),
+        "density": (["traffic", "stations"], ["track.density:load_traffic_hexbins"]),
+    }),
+    ("combine", {
+        "entities": (["stations", "frequentation", "prices", "regularity"],
+                     ["track.entities:load_station_entities", "track.entities:load_od_facts"]),
+    }),
+]
+
+# Per-process indexes built in this process once the files are ready, by page
+# (the default view of the stations page is rendered too)
+ATTACH_STEPS = {
+    "French stations": (["stations"], ["track.spatial:load_station_index",
+                                       "track.station_views:get_station_views:All categories:All regions"]),
+    "Traffic density": (["traffic", "stations"], ["track.density:load_traffic_hexbins",
+                                                  "track.density:get_density_map"]),
+    "Station use": (["frequentation"], ["track.traffic:load_traffic_store"]),
+    "Prices": (["prices", "stations"], ["track.prices:load_route_index:prices",
+                                        "track.prices:load_route_index:priced_routes"]),
+    "Regularity": (["regularity"], ["track.regularity:load_regularity_cube",
+                                    "track.regularity:load_partition_fingerprints",
+                                    "track.anomalies:load_anomaly_scores"]),
+    "Railway lines": (["railway_lines"], ["track.railway:load_line_summary", "track.railway:load_line_tiers",
+                                          "track.network:load_rail_network"]),
+    "Station ids": (["stations", "frequentation", "prices", "regularity"],
+                    ["track.entities:load_station_resolver", "track.entities:load_od_facts"]),
+}
+
+_status = {}
+_status_lock = threading.Lock()
+_thread = None
+_thread_lock = threading.Lock()
+
+
+# Call a loader given as "module:function" or "module:function:argument"
+def _call(loader):
+    module, function, *args = loader.split(':')
+    return getattr(importlib.import_module(module), function)(*args)
+
+
+# Runs in a worker process: the groups ({step: loaders}) one after the other, the loaders of a group in
+# order; a failing group does not stop the next ones
+def _run_groups(groups):
+    results = {}
+    for step, loaders in groups.items():
+        start = time.perf_counter()
+        try:
+            for loader in loaders:
+                _call(loader)
+        except Exception as error:
+            results[step] = {'state': 'failed', 'error': f"{type(error).__name__}: {error}"}
+        else:
+            results[step] = {'state': 'done', 'seconds': round(time.perf_counter() - start, 2)}
+    return results
+
+
+# Run groups in a worker process started in the current directory (the data paths are relative to it)
+def _run_worker(groups):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(Path(__file__).resolve().parents[1]),
+                                                      env.get('PYTHONPATH')]))
+    worker = subprocess.run([sys.executable, "-m", "track.warmup", "--worker"], input=json.dumps(groups),
+                            env=env, capture_output=True, text=True)
+    if worker.returncode != 0:
+        lines = worker.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"worker exited with status {worker.returncode}")
+    return json.loads(worker.stdout.strip().splitlines()[-1])
+
+
+def _set(step, **fields):
+    with _status_lock:
+        _status.setdefault(step, {'step': step, 'state': 'pending', 'seconds': None, 'error': None}).update(fields)
+
+
+# The data layer (and pandas) is imported by the warm-up thread, so the Home page that starts it stays light
+def _available(sources):
+    from track.data import DATASETS
+
+    return all(DATASETS[source].path.exists() for source in sources)
+
+
+def _run_process_stage(pool, workers, stage, groups):
+    runnable = {}
+    for group, (sources, loaders) in groups.items():
+        step = f"{stage}: {group}"
+        if _available(sources):
+            runnable[step] = loaders
+            _set(step, state='running')
+        else:
+            _set(step, state='skipped', error="source file missing")
+    if not runnable:
+        return
+
+    # The groups are shared among the workers, each process paying the imports once
+    steps = list(runnable.items())
+    shares = [dict(steps[worker::workers]) for worker in range(min(workers, len(steps)))]
+    futures = {pool.submit(_run_worker, share): share for share in shares}
+    for future in as_completed(futures):
+        try:
+            results = future.result()
+        except Exception as error:  # Reported; the page needing the table will show the error itself
+            results = dict.fromkeys(futures[future], {'state': 'failed', 'error': f"{type(error).__name__}: {error}"})
+        for step, fields in results.items():
+            _set(step, **fields)
+
+
+def _attach():
+    for page, (sources, loaders) in ATTACH_STEPS.items():
+        step = f"attach: {page}"
+        if not _available(sources):
+            _set(step, state='skipped', error="source file missing")
+            continue
+        _set(step, state='running')
+        start = time.perf_counter()
+        try:
+            for loader in loaders:
+                _call(loader)
+        except Exception as error:
+            _set(step, state='failed', error=f"{type(error).__name__}: {error}")
+        else:
+            _set(step, state='done', seconds=round(time.perf_counter() - start, 2))
+
+    # Optionally render every filter combination of the stations page as well
+    if os.environ.get("TRACK_PREWARM_STATION_VIEWS") == "1" and _available(["stations"]):
+        from track.station_views import prewarm_station_views
+
+        _set("render: station views", state='running')
+        start = time.perf_counter()
+        try:
+            prewarm_station_views()
+        except Exception as error:
+            _set("render: station views", state='failed', error=f"{type(error).__name__}: {error}")
+        else:
+            _set("render: station views", state='done', seconds=round(time.perf_counter() - start, 2))
+
+
+def run_warmup(workers=None):
+    from track.data import DATASETS
+
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    stages = [("parse", {name: ([name], [f"track.data:load_dataset:{name}"]) for name in DATASETS})]
+    stages += PROCESS_STAGES
+    for stage, groups in stages:
+        for group in groups:
+            _set(f"{stage}: {group}")
+    for page in ATTACH_STEPS:
+        _set(f"attach: {page}")
+
+    # One thread per running worker process
+    workers = min(workers, max(len(groups) for _, groups in stages))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="track-warmup") as pool:
+        for stage, groups in stages:
+            _run_process_stage(pool, workers, stage, groups)
+    _attach()
+
+    failed = warmup_failures()
+    logger.info("warm-up finished in %.1fs%s", time.perf_counter() - start,
+                f" ({len(failed)} failed: {', '.join(failed)})" if failed else "")
+    return warmup_report()
+
+
+# Start the warm-up in a background thread, once per process
+def start_warmup():
+    global _thread
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=run_warmup, name="track-warmup", daemon=True)
+            _thread.start()
+    return _thread
+
+
+# State of every warm-up step: pending, running, done, failed or skipped
+def warmup_report():
+    with _status_lock:
+        return [dict(row) for row in _status.values()]
+
+
+# Whether every step has finished, successfully or not (see warmup_failures)
+def warmup_ready():
+    report = warmup_report()
+    return bool(report) and all(row['state'] in ('done', 'skipped', 'failed') for row in report)
+
+
+def warmup_failures():
+    return [row['step'] for row in warmup_report() if row['state'] == 'failed']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m track.warmup",
+                                     description="Build the cached datasets and derived tables")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--worker", action='store_true', help=argparse.SUPPRESS)  # groups as JSON on stdin
+    args = parser.parse_args(argv)
+    if args.worker:
+        print(json.dumps(_run_groups(json.load(sys.stdin))))
+        return 0
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    report = run_warmup(args.workers)
+    for row in report:
+        seconds = f"{row['seconds']:.2f}s" if row['seconds'] is not None else ""
+        print(f"{row['step']:<32} {row['state']:<8} {seconds:>8}  {row['error'] or ''}")
+    return 1 if any(row['state'] == 'failed' for row in report) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())